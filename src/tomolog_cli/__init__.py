@@ -1,10 +1,27 @@
+import importlib
+
 from tomolog_cli.config import *
 from tomolog_cli.log import *
-from tomolog_cli.auth import *
-from tomolog_cli.google_snippets import *
-
-from tomolog_cli.tomolog import *
-from tomolog_cli.tomolog_32id import *
-from tomolog_cli.tomolog_2bm import *
-from tomolog_cli.tomolog_7bm import *
-from tomolog_cli.utils import *
\ No newline at end of file
+
+# The beamline classes and the google/tiff helpers pull in numpy, h5py,
+# matplotlib and the google api client. Load them on first access so that
+# tomolog init/status/-h do not pay for those imports.
+_LAZY = {
+    'TomoLog':                 'tomolog_cli.tomolog',
+    'TomoLog32ID':             'tomolog_cli.tomolog_32id',
+    'TomoLog2BM':              'tomolog_cli.tomolog_2bm',
+    'TomoLog7BM':              'tomolog_cli.tomolog_7bm',
+    'google_slide':            'tomolog_cli.auth',
+    'extract_presentation_id': 'tomolog_cli.auth',
+    'SlidesSnippets':          'tomolog_cli.google_snippets',
+    'find_min_max':            'tomolog_cli.utils',
+    'read_tiff':               'tomolog_cli.utils',
+}
+
+
+def __getattr__(name):
+    if name in _LAZY:
+        value = getattr(importlib.import_module(_LAZY[name]), name)
+        globals()[name] = value
+        return value
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
@@ -1,25 +1,54 @@
 import os
+import re
 import sys
 import time
 import pathlib 
 import argparse
 
-from datetime import datetime
+from functools import lru_cache
 
 from tomolog_cli import log
-from tomolog_cli import utils
 from tomolog_cli import config
-from tomolog_cli import TomoLog
-from tomolog_cli import TomoLog32ID
-from tomolog_cli import TomoLog2BM
-from tomolog_cli import TomoLog7BM
+
+# data files picked up when --file-name is a directory
+H5_SUFFIXES = ('.h5', '.hdf', '.hdf5')
+# trailing scan number, e.g. 657 in sample_0657.h5
+SCAN_NUMBER = re.compile(r'(\d+)(?=\.\w+$)')
+
+# slide formatting class for each --beamline choice, TomoLog for any other
+BEAMLINE_CLASSES = {
+    '32-id': 'TomoLog32ID',
+    '2-bm':  'TomoLog2BM',
+    '7-bm':  'TomoLog7BM',
+}
+
+
+def scan_index(fname):
+    """Sort key ordering files numerically by scan number (_9 before _10)"""
+    m = SCAN_NUMBER.search(fname)
+    return (int(m.group(1)) if m else -1, fname)
+
+
+def is_complete(entry, min_age):
+    """False for empty files and files modified in the last min_age seconds (still being acquired)"""
+    st = entry.stat(follow_symlinks=False)
+    if st.st_size == 0 or time.time() - st.st_mtime < min_age:
+        log.warning("  skipping %s: file is empty or still being written", entry.name)
+        return False
+    return True
+
+
+@lru_cache(maxsize=None)
+def _params_for(sections):
+    # run, status and gui share the same sections: build their Params once
+    return config.Params(sections=sections)
 
 
 def init(args):
     if not os.path.exists(str(args.config)):
         config.write(args.config)
     else:
-        log.error("{0} already exists".format(args.config))
+        log.error("%s already exists", args.config)
 
 
 def run_gui(args):
@@ -27,19 +56,33 @@ def run_gui(args):
     log.warning('Starting Tomolog GUI')
     
     try:
-        import subprocess
-        import os
-        
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        gui_path = os.path.join(script_dir, 'gui.py')
+        # Run the dash app in this process rather than spawning python gui.py
+        from tomolog_cli import gui
+        gui.main()
         
-        # Run: python gui.py from the same folder
-        subprocess.run(['python', gui_path])
-        
-    except FileNotFoundError:
-        log.error("gui.py file not found in the same directory")
+    except ImportError as e:
+        log.error("Cannot load the GUI: %s", e)
     except Exception as e:
-        log.error(f"Error starting GUI: {e}")
+        log.error("Error starting GUI: %s", e)
+
+
+def run_daemon_start(args):
+    from tomolog_cli import daemon
+    daemon.start()
+
+
+def run_daemon_stop(args):
+    from tomolog_cli import daemon
+    daemon.stop()
+
+
+def run_daemon_status(args):
+    from tomolog_cli import daemon
+    reply = daemon.status()
+    if reply is None:
+        log.warning('tomolog daemon is not running')
+    else:
+        log.info('tomolog daemon running on %s (pid %s)', daemon.DAEMON_SOCKET, reply.get('pid'))
 
 
 def run_status(args):
@@ -47,83 +90,70 @@ def run_status(args):
 
 
 def run_log(args):
+    import tomolog_cli
+
+    # the beamline classes pull in numpy, h5py, matplotlib and the google api
+    # client: the package imports only the one that is needed, on first access
+    TomoLogBeamline = getattr(tomolog_cli, BEAMLINE_CLASSES.get(args.beamline, 'TomoLog'))
+
+    # snapshot the parameters to skip rewriting an unchanged config file
+    params_start = dict(vars(args))
 
     log.warning('Publication start')
     log.warning('Slide formatting for beamline: %s', args.beamline)
     file_path = pathlib.Path(args.file_name)
     if file_path.is_file():
-        log.info("publishing a single file: %s" % args.file_name)
-        if args.beamline == '32-id':
-            TomoLog32ID(args).run_log()
-        elif args.beamline == '2-bm':
-            TomoLog2BM(args).run_log()
-        elif args.beamline == '7-bm':
-            TomoLog7BM(args).run_log()
-        else:
-            TomoLog(args).run_log()
+        log.info("publishing a single file: %s", args.file_name)
+        TomoLogBeamline(args).run_log()
     elif file_path.is_dir():
-        log.info("publishing a multiple files in: %s" % args.file_name)
-        top = os.path.join(args.file_name, '')
-        h5_file_list = list(filter(lambda x: x.endswith(('.h5', '.hdf', 'hdf5')), os.listdir(top)))
-        h5_file_list_sorted = sorted(h5_file_list, key = lambda x: x.split('_')[-1])
-        if (h5_file_list):
-            # h5_file_list.sort()
-            log.info("found: %s" % h5_file_list_sorted) 
+        log.info("publishing a multiple files in: %s", args.file_name)
+        with os.scandir(file_path) as it:
+            h5_file_list_sorted = sorted(
+                (e.name for e in it if e.is_file() and e.name.endswith(H5_SUFFIXES) and is_complete(e, args.min_age)),
+                key=scan_index)
+        if (h5_file_list_sorted):
+            log.info("found: %s", h5_file_list_sorted) 
             index=0
             for fname in h5_file_list_sorted:
-                args.file_name = top + fname
-                log.warning("  *** file %d/%d;  %s" % (index, len(h5_file_list_sorted), fname))
+                args.file_name = os.fspath(file_path / fname)
+                log.warning("  *** file %d/%d;  %s", index, len(h5_file_list_sorted), fname)
                 index += 1
-                if args.beamline == '32-id':
-                    TomoLog32ID(args).run_log()
-                elif args.beamline == '2-bm':
-                    TomoLog2BM(args).run_log()
-                elif args.beamline == '7-bm':
-                    TomoLog7BM(args).run_log()
-                else:
-                    TomoLog(args).run_log()
-                time.sleep(20)
+                TomoLogBeamline(args).run_log()
 
         else:
-            log.error("directory %s does not contain any file" % args.file_name)
+            log.error("directory %s does not contain any file", args.file_name)
     else:
-        log.error("directory or File Name does not exist: %s" % args.file_name)
+        log.error("directory or File Name does not exist: %s", args.file_name)
 
     # args.count = args.count + 1
-    config.write(args.config, args, sections=config.PARAMS)
+    if vars(args) != params_start or not os.path.exists(str(args.config)):
+        config.write(args.config, args, sections=config.PARAMS)
     log.warning('publication end')
     
 def main():
 
-    # make sure logs directory exists
-    logs_home = os.path.join(str(pathlib.Path.home()), 'logs')
-
-    # logs_home = args.logs_home
-    if not os.path.exists(logs_home):
-        os.makedirs(logs_home)
-
-    lfname = os.path.join(logs_home, 'tomolog_' +
-                          datetime.strftime(datetime.now(), "%Y-%m-%d_%H_%M_%S") + '.log')
-    # log_level = 'DEBUG' if args.verbose else "INFO"
-    log.setup_custom_logger(lfname)
-    log.info("Started tomolog")
-    log.info("Saving log at %s" % lfname)
-
     parser = argparse.ArgumentParser()
     parser.add_argument('--config', **config.SECTIONS['general']['config'])
     params = config.PARAMS
 
     cmd_parsers = [
-        ('init',        init,            (),     "Create configuration file"),
-        ('run',         run_log,         params, "Run data logging to google slides"),
-        ('status',      run_status,      params, "Show the tomolog status"),
-        ('gui',         run_gui,         params, "Start Tomolog GUI"),
+        ('init',          init,              (),     "Create configuration file"),
+        ('run',           run_log,           params, "Run data logging to google slides"),
+        ('status',        run_status,        params, "Show the tomolog status"),
+        ('gui',           run_gui,           params, "Start Tomolog GUI"),
+        ('daemon-start',  run_daemon_start,  (),     "Start the upload daemon (keeps the Globus client alive)"),
+        ('daemon-stop',   run_daemon_stop,   (),     "Stop the upload daemon"),
+        ('daemon-status', run_daemon_status, (),     "Show the upload daemon status"),
     ]
 
     subparsers = parser.add_subparsers(title="Commands", metavar='')
 
-    for cmd, func, sections, text in cmd_parsers:
-        cmd_params = config.Params(sections=sections)
+    # build only the arguments of the selected command; -h, --help and
+    # unknown commands fall back to registering all of them
+    selected = [c for c in cmd_parsers if len(sys.argv) > 1 and c[0] == sys.argv[1]]
+
+    for cmd, func, sections, text in selected or cmd_parsers:
+        cmd_params = _params_for(sections)
         cmd_parser = subparsers.add_parser(
             cmd, help=text, formatter_class=argparse.ArgumentDefaultsHelpFormatter)
         cmd_parser = cmd_params.add_arguments(cmd_parser)
@@ -131,6 +161,20 @@ def main():
 
     args = config.parse_known_args(parser, subparser=True)
 
+    # make sure logs directory exists; done after parsing so that -h and
+    # invalid arguments do not create a log file
+    logs_home = os.path.join(str(pathlib.Path.home()), 'logs')
+
+    # logs_home = args.logs_home
+    if not os.path.exists(logs_home):
+        os.makedirs(logs_home)
+
+    lfname = os.path.join(logs_home, 'tomolog_' + time.strftime("%Y-%m-%d_%H_%M_%S") + '.log')
+    # log_level = 'DEBUG' if args.verbose else "INFO"
+    log.setup_custom_logger(lfname)
+    log.info("Started tomolog")
+    log.info("Saving log at %s", lfname)
+
     # make sure token directory exists
     try:
         token_home = args.token_home
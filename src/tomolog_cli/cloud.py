@@ -45,15 +45,24 @@
 
 import socks
 import socket
-import requests
 import subprocess
 import os
 import json
 import shutil
 
 from time import sleep
+from concurrent.futures import ThreadPoolExecutor
 from tomolog_cli import log
 from tomolog_cli import globus as globus_uploader
+from tomolog_cli import daemon
+
+# one background worker: uploads run one at a time, since upload() patches the socket
+# module and counts the images in args, but overlap with the plotting of the next image
+_upload_executor = ThreadPoolExecutor(max_workers=1)
+
+def upload_async(args, filename):
+    """Start uploading filename in the background and return a Future resolving to its url"""
+    return _upload_executor.submit(upload, args, filename)
 
 def upload(args, filename):
 
@@ -69,6 +78,8 @@ def upload(args, filename):
     if args.cloud_service == 'imgur':
         cloud_url = 'https://uploadimgur.com/api/upload'
         log.info('Uploading image to %s' % cloud_url)
+        # only the imgur service needs requests: import it here to keep it off the other upload paths
+        import requests
         with open(filename, "rb") as f:
             response = requests.post(
                 cloud_url,
@@ -109,7 +120,10 @@ def upload(args, filename):
             exit(1)
     elif args.cloud_service == 'globus':
         log.info('Uploading image to globus')
-        url = globus_uploader.upload_file(filename)
+        # reuse the Globus client of a running tomolog daemon, if any
+        url = daemon.upload_file(filename)
+        if not url:
+            url = globus_uploader.upload_file(filename)
         if not url:
             log.error('Globus upload failed for %s' % filename)
             exit(1)
@@ -184,6 +184,10 @@ SECTIONS['file-reading'] = {
         'type': Path,
         'help': "Name of the hdf file",
         'metavar': 'PATH'},
+    'min-age': {
+        'type': float,
+        'default': 10,
+        'help': "When --file-name is a directory, skip files modified less than min-age seconds ago (still being acquired)"},
     'doc-dir': {
         'type': str,
         'default': '.',
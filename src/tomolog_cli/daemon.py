@@ -0,0 +1,121 @@
+"""
+Tomolog upload daemon
+Keeps one authenticated Globus client alive across tomolog run invocations.
+tomolog run forwards its Globus uploads here when the daemon is listening and
+uploads in-process otherwise.
+"""
+
+import os
+import json
+import socket
+import threading
+import socketserver
+
+from tomolog_cli import log
+from tomolog_cli import globus
+
+DAEMON_SOCKET = os.path.expanduser("~/.tomolog.sock")
+
+# cloud.upload and auth.google_slide replace socket.socket with a SOCKS5 proxy
+# socket on private networks: keep the plain class for the local unix socket
+_plain_socket = socket.socket
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    """Serve one JSON request per line: upload, ping or stop"""
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+            except ValueError:
+                self._reply({'error': 'invalid request'})
+                continue
+            cmd = request.get('cmd')
+            if cmd == 'upload':
+                url = globus.upload_file(request['local'], request.get('remote_subpath', 'slides/'))
+                self._reply({'url': url})
+            elif cmd == 'ping':
+                self._reply({'status': 'running', 'pid': os.getpid()})
+            elif cmd == 'stop':
+                self._reply({'status': 'stopping'})
+                # shutdown() blocks until serve_forever returns: call it from another thread
+                threading.Thread(target=self.server.shutdown).start()
+                return
+            else:
+                self._reply({'error': f'unknown command: {cmd}'})
+
+    def _reply(self, message):
+        self.wfile.write((json.dumps(message) + '\n').encode())
+
+
+def _request(message, timeout=None):
+    with _plain_socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        s.settimeout(timeout)
+        s.connect(DAEMON_SOCKET)
+        s.sendall((json.dumps(message) + '\n').encode())
+        with s.makefile('rb') as f:
+            return json.loads(f.readline())
+
+
+def status():
+    """Return the daemon ping reply, or None if no daemon is listening"""
+    if not os.path.exists(DAEMON_SOCKET):
+        return None
+    try:
+        return _request({'cmd': 'ping'}, timeout=2)
+    except (OSError, ValueError):
+        return None
+
+
+def start():
+    """Authenticate with Globus and serve upload requests until stopped"""
+    if status() is not None:
+        log.error('tomolog daemon already running on %s', DAEMON_SOCKET)
+        return
+    if os.path.exists(DAEMON_SOCKET):
+        # left behind by a daemon that did not exit cleanly
+        os.remove(DAEMON_SOCKET)
+
+    # authenticate now, in the foreground, so uploads never prompt for a code
+    globus._auth.get_client()
+
+    server = socketserver.UnixStreamServer(DAEMON_SOCKET, _Handler)
+    os.chmod(DAEMON_SOCKET, 0o600)
+    log.warning('tomolog daemon listening on %s (pid %d)', DAEMON_SOCKET, os.getpid())
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if os.path.exists(DAEMON_SOCKET):
+            os.remove(DAEMON_SOCKET)
+        log.warning('tomolog daemon stopped')
+
+
+def stop():
+    """Ask a running daemon to exit"""
+    if status() is None:
+        log.error('tomolog daemon is not running')
+        return
+    _request({'cmd': 'stop'}, timeout=2)
+    log.info('tomolog daemon stopping')
+
+
+def upload_file(local_file, remote_subpath="slides/"):
+    """
+    Upload file through the daemon and return its HTTP URL
+
+    Returns:
+        str: HTTP URL of uploaded file, or None if no daemon is listening or the upload failed
+    """
+    if not os.path.exists(DAEMON_SOCKET):
+        return None
+    try:
+        reply = _request({'cmd': 'upload', 'local': os.path.abspath(local_file),
+                          'remote_subpath': remote_subpath})
+    except (OSError, ValueError) as e:
+        log.warning('tomolog daemon not reachable: %s', e)
+        return None
+    return reply.get('url')
@@ -11,7 +11,10 @@ import webbrowser
 from pathlib import Path
 from datetime import datetime
 
-import globus_sdk
+from tomolog_cli import log
+
+# globus_sdk (requests, cryptography, ...) is imported where it is used so
+# that loading this module, e.g. from cloud.py, stays cheap
 
 # Configuration - update these for your setup
 GLOBUS_LOCAL_ENDPOINT = "2f701431-55f6-11f0-ad13-0affcfc1d1e5"
@@ -27,26 +30,43 @@ class _GlobusAuth:
     
     def __init__(self):
         self.tokens = None
+        self._native_client = None
+        self._transfer_client = None
+        self._transfer_client_expiry = 0
+    
+    def _get_native_client(self):
+        import globus_sdk
+
+        if self._native_client is None:
+            self._native_client = globus_sdk.NativeAppAuthClient(GLOBUS_CLIENT_ID)
+        return self._native_client
     
     def _load_tokens(self):
+        if self.tokens is not None:
+            return True
         if os.path.exists(GLOBUS_TOKEN_FILE):
             try:
                 with open(GLOBUS_TOKEN_FILE, 'r') as f:
                     self.tokens = json.load(f)
                 return True
-            except:
+            except (OSError, json.JSONDecodeError):
                 pass
         return False
     
     def _save_tokens(self, tokens):
         self.tokens = tokens
-        os.makedirs(os.path.dirname(GLOBUS_TOKEN_FILE), exist_ok=True)
-        with open(GLOBUS_TOKEN_FILE, 'w') as f:
-            json.dump(tokens, f, indent=2)
-        os.chmod(GLOBUS_TOKEN_FILE, 0o600)
+        token_dir = os.path.dirname(GLOBUS_TOKEN_FILE) or "."
+        os.makedirs(token_dir, exist_ok=True)
+        # write a sibling file and rename it, so that an interrupted write
+        # never leaves a truncated token file (forcing a new browser login)
+        tmp_file = f"{GLOBUS_TOKEN_FILE}.tmp.{os.getpid()}"
+        with open(tmp_file, 'w') as f:
+            json.dump(tokens, f)
+        os.chmod(tmp_file, 0o600)
+        os.replace(tmp_file, GLOBUS_TOKEN_FILE)
     
     def _get_fresh_tokens(self):
-        client = globus_sdk.NativeAppAuthClient(GLOBUS_CLIENT_ID)
+        client = self._get_native_client()
         client.oauth2_start_flow(requested_scopes=GLOBUS_SCOPES, refresh_tokens=True)
         
         authorize_url = client.oauth2_get_authorize_url()
@@ -56,7 +76,7 @@ class _GlobusAuth:
         try:
             webbrowser.open(authorize_url)
             print("Browser opened automatically.")
-        except:
+        except webbrowser.Error:
             print("Copy the URL above to your browser.")
         
         auth_code = input("\nPaste authorization code: ").strip()
@@ -71,18 +91,22 @@ class _GlobusAuth:
         if not transfer_tokens or 'refresh_token' not in transfer_tokens:
             return self._get_fresh_tokens()
         
+        import globus_sdk
+
         try:
-            client = globus_sdk.NativeAppAuthClient(GLOBUS_CLIENT_ID)
+            client = self._get_native_client()
             refresh_token = transfer_tokens['refresh_token']
             new_tokens = client.oauth2_refresh_token(refresh_token)
             new_transfer_tokens = new_tokens.by_resource_server['transfer.api.globus.org']
             self.tokens['transfer.api.globus.org'].update(new_transfer_tokens)
             self._save_tokens(self.tokens)
             return self.tokens
-        except:
+        except globus_sdk.AuthAPIError:
+            # refresh token revoked or expired: log in again
             return self._get_fresh_tokens()
     
-    def get_client(self):
+    def _get_transfer_tokens(self):
+        # tokens are read from disk only on first use, then kept in memory
         if not self._load_tokens():
             self._get_fresh_tokens()
         
@@ -96,15 +120,28 @@ class _GlobusAuth:
             if time.time() > transfer_tokens['expires_at_seconds'] - 300:  # 5 min buffer
                 self._refresh_tokens()
                 transfer_tokens = self.tokens['transfer.api.globus.org']
+        return transfer_tokens
+    
+    def get_client(self):
+        import globus_sdk
+
+        # Fast path: tokens in memory and the client's access token still fresh
+        if (self.tokens and self._transfer_client is not None
+                and time.time() < self._transfer_client_expiry - 300):
+            return self._transfer_client
+
+        transfer_tokens = self._get_transfer_tokens()
         
         authorizer = globus_sdk.RefreshTokenAuthorizer(
             transfer_tokens['refresh_token'],
-            globus_sdk.NativeAppAuthClient(GLOBUS_CLIENT_ID),
+            self._get_native_client(),
             access_token=transfer_tokens['access_token'],
             expires_at=transfer_tokens.get('expires_at_seconds')
         )
         
-        return globus_sdk.TransferClient(authorizer=authorizer)
+        self._transfer_client = globus_sdk.TransferClient(authorizer=authorizer)
+        self._transfer_client_expiry = transfer_tokens.get('expires_at_seconds') or 0
+        return self._transfer_client
 
 # Global instance
 _auth = _GlobusAuth()
@@ -120,30 +157,51 @@ def upload_file(local_file, remote_subpath="slides/"):
     Returns:
         str: HTTP URL of uploaded file, or None if failed
     """
-    if not os.path.exists(local_file):
-        print(f"File not found: {local_file}")
-        return None
-    print(local_file)
-    filename = Path(local_file).name
-    remote_path = f"{GLOBUS_REMOTE_BASE_PATH}{remote_subpath}{filename}"
+    urls = upload_files([local_file], remote_subpath)
+    return urls[0] if urls else None
+
+def upload_files(local_files, remote_subpath="slides/"):
+    """
+    Upload several files to Globus in a single transfer and return their HTTP URLs
+    
+    Args:
+        local_files: List of paths to local files
+        remote_subpath: Remote subdirectory (default: "slides/")
+    
+    Returns:
+        list: HTTP URLs of the uploaded files, or None if failed
+    """
+    found = []
+    for local_file in local_files:
+        if not os.path.exists(local_file):
+            log.error("File not found: %s", local_file)
+            return None
+        log.info("Globus upload: %s", local_file)
+        found.append((local_file, Path(local_file).name))
+    if not found:
+        return []
     
     try:
+        import globus_sdk
+
         tc = _auth.get_client()
         
         tdata = globus_sdk.TransferData(
             tc, GLOBUS_LOCAL_ENDPOINT, GLOBUS_REMOTE_ENDPOINT,
-            label=f"Upload: {filename}", sync_level="mtime"
+            label=f"Upload: {', '.join(filename for _, filename in found)}"[:128], sync_level="mtime"
         )
-        tdata.add_item(local_file, remote_path)
+        for local_file, filename in found:
+            tdata.add_item(local_file, f"{GLOBUS_REMOTE_BASE_PATH}{remote_subpath}{filename}")
         
         result = tc.submit_transfer(tdata)
-        http_url = f"{GLOBUS_BASE_URL}{remote_subpath}{filename}"
+        http_urls = [f"{GLOBUS_BASE_URL}{remote_subpath}{filename}" for _, filename in found]
         
-        print(f"Uploaded: {http_url}")
-        return http_url
+        for http_url in http_urls:
+            log.info("Uploaded: %s", http_url)
+        return http_urls
         
     except Exception as e:
-        print(f"Upload failed: {e}")
+        log.error("Upload failed: %s", e)
         return None
 
 def configure(local_endpoint=None, remote_endpoint=None, base_url=None):
@@ -49,17 +49,45 @@ from googleapiclient.http import MediaFileUpload
 
 from tomolog_cli import log
 
+# Slides API requests hitting the quota (429) or a server error (5xx) are
+# retried by googleapiclient with randomized exponential backoff
+NUM_RETRIES = 5
 
 class SlidesSnippets(object):
     def __init__(self, service, credentials):
         self.service = service
         self.credentials = credentials
+        # requests queued between begin_batch and flush_batch
+        self.batch = None
+
+    def begin_batch(self):
+        # queue the requests of the create_* calls so that flush_batch sends them in one batchUpdate
+        self.batch = []
+
+    def flush_batch(self, presentation_id):
+        requests, self.batch = self.batch, None
+        if not requests:
+            return None
+        response = self.batch_update(presentation_id, requests)
+        log.info('Sent {0} google slide requests in one batch'.format(len(requests)))
+        return response
+
+    def batch_update(self, presentation_id, requests):
+        # run the requests now, or queue them while batching
+        if self.batch is not None:
+            self.batch.extend(requests)
+            return None
+        body = {
+            'requests': requests
+        }
+        return self.service.presentations() \
+            .batchUpdate(presentationId=presentation_id, body=body).execute(num_retries=NUM_RETRIES)
 
     def create_slide(self, presentation_id, page_id):
         slides_service = self.service
         # take the current number of slides
         presentation = slides_service.presentations().get(
-            presentationId=presentation_id).execute()
+            presentationId=presentation_id).execute(num_retries=NUM_RETRIES)
         nslides = len(presentation.get('slides'))
         # insert a slide at the end
         requests = [
@@ -74,17 +102,11 @@ class SlidesSnippets(object):
             }
         ]
         # Execute the request.
-        body = {
-            'requests': requests
-        }
-        response = slides_service.presentations().batchUpdate(presentationId=presentation_id, body=body).execute()
-        create_slide_response = response.get('replies')[0].get('createSlide')
-        log.info('Created slide with ID: {0}'.format(
-            create_slide_response.get('objectId')))
+        response = self.batch_update(presentation_id, requests)
+        log.info('Created slide with ID: {0}'.format(page_id))
         return response
     
     def create_textbox_with_text(self, presentation_id, page_id, text, magnitude_width, magnitude_height, posx, posy, fontsize, fontcolor):
-        slides_service = self.service
         # [START slides_create_textbox_with_text]
         # Create a new square textbox, using the supplied element ID.
         element_id = str(uuid.uuid4())
@@ -144,19 +166,12 @@ class SlidesSnippets(object):
         ]
 
         # Execute the request.
-        body = {
-            'requests': requests
-        }
-        response = slides_service.presentations() \
-            .batchUpdate(presentationId=presentation_id, body=body).execute()
-        create_shape_response = response.get('replies')[0].get('createShape')
-        log.info('Created google slide textbox with ID: {0}'.format(
-            create_shape_response.get('objectId')))
+        response = self.batch_update(presentation_id, requests)
+        log.info('Created google slide textbox with ID: {0}'.format(element_id))
         # [END slides_create_textbox_with_text]
         return response    
 
     def create_textbox_with_bullets(self, presentation_id, page_id, text, magnitude_width, magnitude_height, posx, posy, fontsize, fontcolor):
-        slides_service = self.service
         # [START slides_create_textbox_with_text]
         # Create a new square textbox, using the supplied element ID.
         if text=="":
@@ -227,18 +242,11 @@ class SlidesSnippets(object):
         ]
 
         # Execute the request.
-        body = {
-            'requests': requests
-        }
-        response = slides_service.presentations() \
-            .batchUpdate(presentationId=presentation_id, body=body).execute()
-        create_shape_response = response.get('replies')[0].get('createShape')
-        log.info('Created google slide textbox bullets with ID: {0}'.format(
-            create_shape_response.get('objectId')))
+        response = self.batch_update(presentation_id, requests)
+        log.info('Created google slide textbox bullets with ID: {0}'.format(element_id))
         return response            
     
     def create_image(self, presentation_id, page_id, IMAGE_URL, magnitude_width, magnitude_height, posx, posy):
-        slides_service = self.service
         # [START slides_create_image]
         # Create a new image, using the supplied object ID,
         # with content downloaded from IMAGE_URL.
@@ -266,12 +274,6 @@ class SlidesSnippets(object):
         })
 
         # Execute the request.
-        body = {
-            'requests': requests
-        }
-        response = slides_service.presentations() \
-            .batchUpdate(presentationId=presentation_id, body=body).execute()
-        create_image_response = response.get('replies')[0].get('createImage')
-        log.info('Created google slide image with ID: {0}'.format(
-        create_image_response.get('objectId')))        
+        response = self.batch_update(presentation_id, requests)
+        log.info('Created google slide image with ID: {0}'.format(image_id))
         return response
@@ -1,14 +1,18 @@
 import dash
 from dash import dcc, html, Input, Output, State
+from dash.exceptions import PreventUpdate
 import plotly.graph_objects as go
 import numpy as np
 import os
+import io
+import base64
 import subprocess
 import threading
-import glob
 import socket
 import ipaddress
 import re
+import functools
+import collections
 from datetime import datetime
 
 # Optional imports with fallbacks
@@ -18,6 +22,12 @@ try:
 except ImportError:
     HAS_H5PY = False
 
+try:
+    # partial decompression of Blosc2-compressed datasets when slicing
+    import b2h5py.auto
+except ImportError:
+    pass
+
 try:
     from PIL import Image
     HAS_PIL = True
@@ -30,6 +40,12 @@ try:
 except ImportError:
     HAS_TIFFFILE = False
 
+try:
+    import cv2
+    HAS_CV2 = True
+except ImportError:
+    HAS_CV2 = False
+
 try:
     from skimage.transform import resize
     HAS_SKIMAGE = True
@@ -38,9 +54,11 @@ except ImportError:
 
 app = dash.Dash(__name__)
 
+@functools.lru_cache(maxsize=1)
 def check_ip_type():
     try:
         s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        s.settimeout(0.5)
         s.connect(("8.8.8.8", 80))
         local_ip = s.getsockname()[0]
         s.close()
@@ -54,23 +72,48 @@ def check_ip_type():
 
 # Global state
 app_state = {
-    'logs': [],
+    'logs': collections.deque(maxlen=50),
+    'pending_logs': [],
+    'logs_version': 0,
     'status': 'Ready',
     'process_running': False,
     'current_process': None,
     'preview_data': None,
-    'preview_data_original': None,
+    'preview_buf': None,
+    'slice_range_key': None,
+    'tiff_cache': {},
     'preview_file': None,
+    'preview_version': 0,
     'file_info': {},
-    'ip_type': check_ip_type(),
+    'ip_type': None,
     'roi_coords': None
 }
 
+# Strip terminal colour codes from the tomolog output shown in the log panel
+ANSI_ESCAPE = re.compile(rb'\x1B\[[0-?]*[ -/]*[@-~]')
+
+log_lock = threading.Lock()
+
 def add_log(message):
     timestamp = datetime.now().strftime('%H:%M:%S')
-    app_state['logs'].append(f"{timestamp} - {message}")
-    if len(app_state['logs']) > 50:
-        app_state['logs'] = app_state['logs'][-50:]
+    with log_lock:
+        _flush_pending_logs()
+        app_state['logs'].append(f"{timestamp} - {message}")
+        app_state['logs_version'] += 1
+
+def queue_log(message):
+    """Buffer a tomolog output line; it is moved to the log panel on the next refresh"""
+    timestamp = datetime.now().strftime('%H:%M:%S')
+    app_state['pending_logs'].append(f"{timestamp} - {message}")
+
+def _flush_pending_logs():
+    pending = app_state['pending_logs']
+    if not pending:
+        return
+    batch = pending[:len(pending)]
+    del pending[:len(batch)]
+    app_state['logs'].extend(batch)
+    app_state['logs_version'] += 1
 
 def get_slides_path(url):
     """Return the full slides URL/path as provided"""
@@ -81,6 +124,49 @@ def get_slides_path(url):
     add_log(f"Using slides path: {url}")
     return url
 
+@functools.lru_cache(maxsize=256)
+def _rec_path_for(file_path):
+    """<base>/<exp>_rec/<name>_rec for a raw <base>/<exp>/<name>.h5, None for anything else"""
+    if not file_path.endswith('.h5') or 'rec' in file_path:
+        return None
+    path_parts = file_path.split('/')
+    base_dir = '/'.join(path_parts[:-2])
+    experiment_dir = path_parts[-2]
+    filename = path_parts[-1]
+    base_name = os.path.splitext(filename)[0]
+    rec_name = f"{base_name}_rec"
+    rec_dir = f"{experiment_dir}_rec"
+    return os.path.join(base_dir, rec_dir, rec_name)
+
+def resolve_rec_path(file_path):
+    """Reconstruction directory of a raw H5 file if it exists, otherwise file_path"""
+    rec_path = _rec_path_for(file_path)
+    # the existence check is not memoized: the reconstruction may appear while the GUI is open
+    if rec_path is not None and os.path.exists(rec_path):
+        return rec_path
+    return file_path
+
+# Slice number of a reconstruction TIFF: the last digit run before the extension
+SLICE_NUMBER = re.compile(r'(\d+)\D*$')
+
+def slice_index(path):
+    """Sort key putting recon_9.tiff before recon_10.tiff"""
+    match = SLICE_NUMBER.search(os.path.basename(path))
+    return (int(match.group(1)) if match else -1, path)
+
+def list_tiff_files(directory):
+    """TIFF paths in directory in slice order, rescanned only when the directory mtime changes"""
+    mtime = os.stat(directory).st_mtime
+    cached = app_state['tiff_cache'].get(directory)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    
+    tiff_files = sorted((entry.path for entry in os.scandir(directory)
+                         if entry.name.lower().endswith(('.tif', '.tiff')) and entry.is_file()),
+                        key=slice_index)
+    app_state['tiff_cache'][directory] = (mtime, tiff_files)
+    return tiff_files
+
 def get_slice_count(file_path, file_start=657):
     """Get the number of available slices from the reconstruction directory"""
     if not file_path:
@@ -94,55 +180,80 @@ def get_slice_count(file_path, file_start=657):
             preview_file = file_path
         
         # Try reconstruction directory first
-        if preview_file.endswith('.h5') and 'rec' not in preview_file:
-            path_parts = preview_file.split('/')
-            base_dir = '/'.join(path_parts[:-2])
-            experiment_dir = path_parts[-2]
-            filename = path_parts[-1]
-            base_name = os.path.splitext(filename)[0]
-            rec_name = f"{base_name}_rec"
-            rec_dir = f"{experiment_dir}_rec"
-            rec_path = os.path.join(base_dir, rec_dir, rec_name)
-            
-            if os.path.exists(rec_path):
-                preview_file = rec_path
-        
-        # Count TIFF files in directory
-        if os.path.isdir(preview_file):
-            tiff_files = []
-            for pattern in ['*.tif', '*.tiff', '*.TIF', '*.TIFF']:
-                tiff_files.extend(glob.glob(os.path.join(preview_file, pattern)))
-            
-            if tiff_files:
-                add_log(f"Found {len(tiff_files)} TIFF files for slice range")
-                return len(tiff_files)
+        preview_file = resolve_rec_path(preview_file)
         
-        # Check H5 file dimensions
-        elif preview_file.endswith('.h5') and HAS_H5PY:
-            with h5py.File(preview_file, 'r') as f:
-                possible_paths = ['exchange/data', 'data', 'tomo', 'reconstruction']
-                
-                for path in possible_paths:
-                    if path in f:
-                        data_array = f[path]
-                        if len(data_array.shape) == 3:
-                            add_log(f"Found {data_array.shape[0]} slices in H5 file")
-                            return data_array.shape[0]
-                        break
-                
-                # Search for any 3D dataset
-                for key in f.keys():
-                    if isinstance(f[key], h5py.Dataset) and len(f[key].shape) == 3:
-                        add_log(f"Found {f[key].shape[0]} slices in H5 dataset: {key}")
-                        return f[key].shape[0]
+        # Keyed on mtime so a directory still being filled or a rewritten file is counted again
+        try:
+            mtime = os.stat(preview_file).st_mtime
+        except OSError:
+            slice_count = _slice_count_impl.__wrapped__(preview_file, None)
+        else:
+            slice_count = _slice_count_impl(preview_file, mtime)
         
-        add_log("Could not determine slice count, using default 100")
-        return 100
+        if slice_count is None:
+            add_log("Could not determine slice count, using default 100")
+            return 100
+        return slice_count
         
     except Exception as e:
         add_log(f"Error getting slice count: {str(e)}")
         return 100
 
+@functools.lru_cache(maxsize=64)
+def _slice_count_impl(preview_file, mtime):
+    """Count slices in a TIFF directory or 3D H5 dataset, None if unknown"""
+    # Count TIFF files in directory
+    if os.path.isdir(preview_file):
+        tiff_files = list_tiff_files(preview_file)
+        
+        if tiff_files:
+            add_log(f"Found {len(tiff_files)} TIFF files for slice range")
+            return len(tiff_files)
+    
+    # Check H5 file dimensions
+    elif preview_file.endswith('.h5') and HAS_H5PY:
+        name, shape = find_h5_dataset(preview_file, mtime, 3)
+        if name is not None:
+            add_log(f"Found {shape[0]} slices in H5 dataset: {name}")
+            return shape[0]
+    
+    return None
+
+@functools.lru_cache(maxsize=64)
+def find_h5_dataset(file_path, mtime, ndim):
+    """
+    Name and shape of the image dataset in an H5 file, (None, None) if there is none
+    
+    The first of the usual paths that exists is used if it has at least ndim dimensions,
+    otherwise the first top-level dataset that does. Cached per file mtime.
+    """
+    with h5py.File(file_path, 'r') as f:
+        for path in ['exchange/data', 'data', 'tomo', 'reconstruction']:
+            if path in f:
+                if len(f[path].shape) >= ndim:
+                    return path, f[path].shape
+                break
+        
+        for key in f.keys():
+            if isinstance(f[key], h5py.Dataset) and len(f[key].shape) >= ndim:
+                return key, f[key].shape
+    return None, None
+
+def preview_strides(shape):
+    """Row and column steps that bring an image of this shape down to 512-1023 px per axis"""
+    return max(1, shape[-2] // 512), max(1, shape[-1] // 512)
+
+def read_tiff_preview(file_name):
+    """Read a TIFF slice, only every stride-th pixel when it is uncompressed"""
+    try:
+        # uncompressed, contiguous slices are memory-mapped: only the sampled rows are paged in
+        volume = tifffile.memmap(file_name, mode='r')
+    except ValueError:
+        return tifffile.imread(file_name)
+    sy, sx = preview_strides(volume.shape)
+    # copy out of the read-only map, the preview is normalized in place
+    return np.array(volume[..., ::sy, ::sx])
+
 def load_image_for_preview(file_path, slice_num):
     """Load image data for preview only - no processing"""
     if not file_path:
@@ -150,36 +261,24 @@ def load_image_for_preview(file_path, slice_num):
     
     try:
         # Try reconstruction directory first
-        if file_path.endswith('.h5') and 'rec' not in file_path:
-            path_parts = file_path.split('/')
-            base_dir = '/'.join(path_parts[:-2])
-            experiment_dir = path_parts[-2]
-            filename = path_parts[-1]
-            base_name = os.path.splitext(filename)[0]
-            rec_name = f"{base_name}_rec"
-            rec_dir = f"{experiment_dir}_rec"
-            rec_path = os.path.join(base_dir, rec_dir, rec_name)
-            
-            if os.path.exists(rec_path):
-                add_log(f"Using reconstruction directory: {rec_path}")
-                file_path = rec_path
+        rec_path = resolve_rec_path(file_path)
+        if rec_path != file_path:
+            add_log(f"Using reconstruction directory: {rec_path}")
+            file_path = rec_path
         
         # Load from TIFF directory
         if os.path.isdir(file_path):
-            tiff_files = []
-            for pattern in ['*.tif', '*.tiff', '*.TIF', '*.TIFF']:
-                tiff_files.extend(glob.glob(os.path.join(file_path, pattern)))
+            tiff_files = list_tiff_files(file_path)
             
             if not tiff_files:
                 add_log("No TIFF files found")
                 return None
             
-            tiff_files.sort()
             slice_idx = min(slice_num, len(tiff_files) - 1)
             selected_file = tiff_files[slice_idx]
             
             if HAS_TIFFFILE:
-                data = tifffile.imread(selected_file)
+                data = read_tiff_preview(selected_file)
             elif HAS_PIL:
                 data = np.array(Image.open(selected_file))
             else:
@@ -188,43 +287,54 @@ def load_image_for_preview(file_path, slice_num):
         
         # Load from H5 file
         elif file_path.endswith('.h5') and HAS_H5PY:
+            name, shape = find_h5_dataset(file_path, os.stat(file_path).st_mtime, 2)
+            if name is None:
+                add_log("No data found in H5 file")
+                return None
+            
             with h5py.File(file_path, 'r') as f:
-                possible_paths = ['exchange/data', 'data', 'tomo', 'reconstruction']
-                data_array = None
-                
-                for path in possible_paths:
-                    if path in f:
-                        data_array = f[path]
-                        break
-                
-                if data_array is None:
-                    for key in f.keys():
-                        if isinstance(f[key], h5py.Dataset) and len(f[key].shape) >= 2:
-                            data_array = f[key]
-                            break
-                
-                if data_array is None:
-                    add_log("No data found in H5 file")
-                    return None
+                data_array = f[name]
                 
+                # hyperslab with a stride per axis so HDF5 returns roughly the 512 px preview
+                sy, sx = preview_strides(data_array.shape)
                 if len(data_array.shape) == 3:
                     slice_idx = min(slice_num, data_array.shape[0] - 1)
-                    data = data_array[slice_idx, :, :]
+                    data = data_array[slice_idx, ::sy, ::sx]
                 else:
-                    data = data_array[:, :]
+                    data = data_array[::sy, ::sx]
         else:
             add_log("Unsupported file type")
             return None
         
-        # Basic normalization for display
-        data = np.array(data, dtype=np.float32)
-        if data.max() > data.min():
-            data = (data - data.min()) / (data.max() - data.min())
-        
-        # Resize if too large
+        # Resize if too large, before normalizing so only the preview-sized array is touched
         if data.shape[0] > 512 or data.shape[1] > 512:
-            if HAS_SKIMAGE:
-                data = resize(data, (min(512, data.shape[0]), min(512, data.shape[1])))
+            new_h = min(512, data.shape[0])
+            new_w = min(512, data.shape[1])
+            if HAS_CV2:
+                if data.dtype not in (np.uint8, np.uint16, np.int16, np.float32, np.float64):
+                    data = data.astype(np.float32)
+                # area averaging in the native dtype, no float64 intermediates
+                data = cv2.resize(data, (new_w, new_h), interpolation=cv2.INTER_AREA)
+            elif HAS_SKIMAGE:
+                data = resize(data, (new_h, new_w), preserve_range=True)
+        
+        # Basic normalization for display
+        if data.dtype == np.uint8:
+            # 8-bit slices: normalize the 256 possible values once and gather
+            mn = int(data.min())
+            mx = int(data.max())
+            lut = np.arange(256, dtype=np.float32)
+            if mx > mn:
+                lut = (lut - mn) * np.float32(1.0 / (mx - mn))
+            data = lut[data]
+        else:
+            # in place: data is a fresh array owned by this call
+            data = np.asarray(data, dtype=np.float32)
+            mn = float(data.min())
+            mx = float(data.max())
+            if mx > mn:
+                np.subtract(data, mn, out=data)
+                np.multiply(data, np.float32(1.0 / (mx - mn)), out=data)
         
         add_log(f"Loaded image: {data.shape}")
         return data
@@ -233,6 +343,17 @@ def load_image_for_preview(file_path, slice_num):
         add_log(f"Error loading image: {str(e)}")
         return None
 
+def scale_intensity(data, min_intensity, max_intensity):
+    """Map [min_intensity, max_intensity] to [0, 1] into a preview buffer reused across slider ticks"""
+    buf = app_state.get('preview_buf')
+    if buf is None or buf.shape != data.shape:
+        buf = np.empty_like(data)
+        app_state['preview_buf'] = buf
+    np.subtract(data, min_intensity, out=buf)
+    np.multiply(buf, 1.0 / (max_intensity - min_intensity), out=buf)
+    np.clip(buf, 0, 1, out=buf)
+    return buf
+
 def generate_file_list(file_template, start, count):
     """Generate list of files based on template and range"""
     if not file_template or '{}' not in file_template:
@@ -310,18 +431,31 @@ def run_tomolog_cli(params):
                 cmd,
                 stdout=subprocess.PIPE,
                 stderr=subprocess.STDOUT,
-                text=True,
-                universal_newlines=True,
-                bufsize=1
+                bufsize=0
             )
             
             app_state['current_process'] = process
             
-            ANSI_ESCAPE = re.compile(r'\x1B\[[0-?]*[ -/]*[@-~]')
-            # Read output line by line
-            for line in iter(process.stdout.readline, ''):
-                if line:
-                    add_log(ANSI_ESCAPE.sub('', line.rstrip()))
+            # Read whatever the pipe holds and split it into lines ourselves;
+            # lines reach the log panel in batches on each refresh
+            fd = process.stdout.fileno()
+            pending = b''
+            while True:
+                chunk = os.read(fd, 65536)
+                if not chunk:
+                    break
+                pending += chunk
+                end = pending.rfind(b'\n') + 1
+                if not end:
+                    continue
+                # one pass over all complete lines; escape codes never span a newline
+                lines = ANSI_ESCAPE.sub(b'', pending[:end]).split(b'\n')[:-1]
+                pending = pending[end:]
+                for line in lines:
+                    queue_log(line.decode('utf-8', 'replace').rstrip())
+            if pending:
+                queue_log(ANSI_ESCAPE.sub(b'', pending).decode('utf-8', 'replace').rstrip())
+            process.stdout.close()
             
             # Wait for process to complete
             process.wait()
@@ -352,177 +486,183 @@ def run_tomolog_cli(params):
         app_state['process_running'] = False
         app_state['current_process'] = None
 
-# Layout
-app.layout = html.Div([
-    # Add interval for real-time updates
-    dcc.Interval(
-        id='interval-component',
-        interval=1000,  # Update every second
-        n_intervals=0
-    ),
-    
-    # Header
-    html.Div([
-        html.H2("Tomolog Interface", style={'margin': 0, 'color': 'white'}),
-        html.Span("Parameter Setup for tomolog", style={'color': '#aaa', 'fontSize': '14px'})
-    ], style={
-        'background': '#333',
-        'padding': '15px 20px', 
-        'marginBottom': '10px'
-    }),
-    
-    # Main layout
-    html.Div([
-        # Left column - Controls
+# Layout, built per page load so the network check is not run at import
+def serve_layout():
+    app_state['ip_type'] = check_ip_type()
+    return html.Div([
+        # Add interval for real-time updates
+        dcc.Interval(
+            id='interval-component',
+            interval=1000,  # Update every second while tomolog runs
+            n_intervals=0
+        ),
+        dcc.Store(id='logs-version'),
+        dcc.Store(id='preview-orig', storage_type='memory'),
+    
+        # Header
         html.Div([
-            # File input
+            html.H2("Tomolog Interface", style={'margin': 0, 'color': 'white'}),
+            html.Span("Parameter Setup for tomolog", style={'color': '#aaa', 'fontSize': '14px'})
+        ], style={
+            'background': '#333',
+            'padding': '15px 20px', 
+            'marginBottom': '10px'
+        }),
+    
+        # Main layout
+        html.Div([
+            # Left column - Controls
             html.Div([
-                html.H4("Data File(s)", style={'color': '#e0e0e0', 'marginBottom': '8px'}),
+                # File input
+                html.Div([
+                    html.H4("Data File(s)", style={'color': '#e0e0e0', 'marginBottom': '8px'}),
                 
-                dcc.Input(id="file-path", placeholder="H5 file path template (use {} for number)", 
-                         value="/data/32ID/2025-07/2025-07/Mittone/Allen_Particle_capillary_{}.h5",
-                         style={'width': '100%', 'marginBottom': '8px', 'padding': '6px', 
-                               'backgroundColor': '#444', 'color': 'white', 'border': '1px solid #666'}),
+                    dcc.Input(id="file-path", placeholder="H5 file path template (use {} for number)", 
+                             value="/data/32ID/2025-07/2025-07/Mittone/Allen_Particle_capillary_{}.h5",
+                             style={'width': '100%', 'marginBottom': '8px', 'padding': '6px', 
+                                   'backgroundColor': '#444', 'color': 'white', 'border': '1px solid #666'}),
                 
-                html.Div([
-                    html.Label("File Range:", style={'color': '#e0e0e0', 'fontSize': '12px', 'display': 'block', 'marginBottom': '4px'}),
-                    html.Div([
-                        dcc.Input(id="file-start", type="number", value=657, placeholder="Start",
-                                 style={'width': '48%', 'marginRight': '4%', 'padding': '4px',
-                                       'backgroundColor': '#444', 'color': 'white', 'border': '1px solid #666'}),
-                        dcc.Input(id="file-count", type="number", value=1, placeholder="Count",
-                                 style={'width': '48%', 'padding': '4px',
-                                       'backgroundColor': '#444', 'color': 'white', 'border': '1px solid #666'})
-                    ], style={'display': 'flex', 'marginBottom': '4px'}),
                     html.Div([
-                        html.Span("Start: ", style={'color': '#aaa', 'fontSize': '11px'}),
-                        html.Span(id="file-start-display", style={'color': '#e0e0e0', 'fontSize': '11px'}),
-                        html.Span(" | End: ", style={'color': '#aaa', 'fontSize': '11px'}),
-                        html.Span(id="file-end-display", style={'color': '#e0e0e0', 'fontSize': '11px'}),
-                        html.Span(" | Total: ", style={'color': '#aaa', 'fontSize': '11px'}),
-                        html.Span(id="file-total-display", style={'color': '#4fc3f7', 'fontSize': '11px'})
+                        html.Label("File Range:", style={'color': '#e0e0e0', 'fontSize': '12px', 'display': 'block', 'marginBottom': '4px'}),
+                        html.Div([
+                            dcc.Input(id="file-start", type="number", value=657, placeholder="Start",
+                                     style={'width': '48%', 'marginRight': '4%', 'padding': '4px',
+                                           'backgroundColor': '#444', 'color': 'white', 'border': '1px solid #666'}),
+                            dcc.Input(id="file-count", type="number", value=1, placeholder="Count",
+                                     style={'width': '48%', 'padding': '4px',
+                                           'backgroundColor': '#444', 'color': 'white', 'border': '1px solid #666'})
+                        ], style={'display': 'flex', 'marginBottom': '4px'}),
+                        html.Div([
+                            html.Span("Start: ", style={'color': '#aaa', 'fontSize': '11px'}),
+                            html.Span(id="file-start-display", style={'color': '#e0e0e0', 'fontSize': '11px'}),
+                            html.Span(" | End: ", style={'color': '#aaa', 'fontSize': '11px'}),
+                            html.Span(id="file-end-display", style={'color': '#e0e0e0', 'fontSize': '11px'}),
+                            html.Span(" | Total: ", style={'color': '#aaa', 'fontSize': '11px'}),
+                            html.Span(id="file-total-display", style={'color': '#4fc3f7', 'fontSize': '11px'})
+                        ])
                     ])
-                ])
-            ], style={'backgroundColor': '#333', 'padding': '10px', 'borderRadius': '5px', 'marginBottom': '10px'}),
+                ], style={'backgroundColor': '#333', 'padding': '10px', 'borderRadius': '5px', 'marginBottom': '10px'}),
             
-            # Parameters
-            html.Div([
-                html.H4("Parameters", style={'color': '#e0e0e0', 'marginBottom': '8px'}),
+                # Parameters
+                html.Div([
+                    html.H4("Parameters", style={'color': '#e0e0e0', 'marginBottom': '8px'}),
                 
-                html.Label("Slice Number:", style={'color': '#e0e0e0', 'fontSize': '12px'}),
-                dcc.Slider(id="slice-slider", min=0, max=100, value=50, step=1,
-                          marks={},  # Dynamic marks will be set by callback
-                          tooltip={"placement": "bottom", "always_visible": True}),
-                html.Div(id="slice-info", style={'color': '#aaa', 'fontSize': '11px', 'marginTop': '4px'}),
+                    html.Label("Slice Number:", style={'color': '#e0e0e0', 'fontSize': '12px'}),
+                    dcc.Slider(id="slice-slider", min=0, max=100, value=50, step=1,
+                              marks={},  # Dynamic marks will be set by callback
+                              tooltip={"placement": "bottom", "always_visible": True}),
+                    html.Div(id="slice-info", style={'color': '#aaa', 'fontSize': '11px', 'marginTop': '4px'}),
                 
-                html.Label("Min Intensity:", style={'color': '#e0e0e0', 'fontSize': '12px', 'marginTop': '8px', 'display': 'block'}),
-                dcc.Slider(id="min-intensity", min=0, max=1, value=0, step=0.01,
-                          marks={0: {'label': '0', 'style': {'color': '#aaa', 'fontSize': '9px'}},
-                                1: {'label': '1', 'style': {'color': '#aaa', 'fontSize': '9px'}}},
-                          tooltip={"placement": "bottom", "always_visible": True}),
+                    html.Label("Min Intensity:", style={'color': '#e0e0e0', 'fontSize': '12px', 'marginTop': '8px', 'display': 'block'}),
+                    dcc.Slider(id="min-intensity", min=0, max=1, value=0, step=0.01,
+                              marks={0: {'label': '0', 'style': {'color': '#aaa', 'fontSize': '9px'}},
+                                    1: {'label': '1', 'style': {'color': '#aaa', 'fontSize': '9px'}}},
+                              tooltip={"placement": "bottom", "always_visible": True}),
                 
-                html.Label("Max Intensity:", style={'color': '#e0e0e0', 'fontSize': '12px', 'marginTop': '6px', 'display': 'block'}),
-                dcc.Slider(id="max-intensity", min=0, max=1, value=1, step=0.01,
-                          marks={0: {'label': '0', 'style': {'color': '#aaa', 'fontSize': '9px'}},
-                                1: {'label': '1', 'style': {'color': '#aaa', 'fontSize': '9px'}}},
-                          tooltip={"placement": "bottom", "always_visible": True}),
+                    html.Label("Max Intensity:", style={'color': '#e0e0e0', 'fontSize': '12px', 'marginTop': '6px', 'display': 'block'}),
+                    dcc.Slider(id="max-intensity", min=0, max=1, value=1, step=0.01,
+                              marks={0: {'label': '0', 'style': {'color': '#aaa', 'fontSize': '9px'}},
+                                    1: {'label': '1', 'style': {'color': '#aaa', 'fontSize': '9px'}}},
+                              tooltip={"placement": "bottom", "always_visible": True}),
                 
-                html.Div(id="roi-info", style={'marginTop': '10px', 'color': '#aaa', 'fontSize': '12px'})
-            ], style={'backgroundColor': '#333', 'padding': '10px', 'borderRadius': '5px', 'marginBottom': '10px'}),
+                    html.Div(id="roi-info", style={'marginTop': '10px', 'color': '#aaa', 'fontSize': '12px'})
+                ], style={'backgroundColor': '#333', 'padding': '10px', 'borderRadius': '5px', 'marginBottom': '10px'}),
             
-            # Google settings with cloud service
-            html.Div([
-                html.H4("Settings", style={'color': '#e0e0e0', 'marginBottom': '8px'}),
+                # Google settings with cloud service
+                html.Div([
+                    html.H4("Settings", style={'color': '#e0e0e0', 'marginBottom': '8px'}),
                 
-                dcc.Input(id="slides-url", placeholder="Google Slides URL",
-                         value="https://docs.google.com/presentation/d/13-4469-a4b0-91f35a517985/edit",
-                         style={'width': '100%', 'marginBottom': '6px', 'padding': '6px',
-                               'backgroundColor': '#444', 'color': 'white', 'border': '1px solid #666'}),
+                    dcc.Input(id="slides-url", placeholder="Google Slides URL",
+                             value="https://docs.google.com/presentation/d/13-4469-a4b0-91f35a517985/edit",
+                             style={'width': '100%', 'marginBottom': '6px', 'padding': '6px',
+                                   'backgroundColor': '#444', 'color': 'white', 'border': '1px solid #666'}),
                 
-                html.Div([
-                    html.Label(f"Visibility (auto-detected: {app_state['ip_type']}):", 
-                              style={'color': '#e0e0e0', 'fontSize': '12px', 'display': 'block', 'marginBottom': '4px'}),
-                    dcc.RadioItems(id="visibility",
-                                 options=[
-                                     {'label': ' Public', 'value': 'public'},
-                                     {'label': ' Private', 'value': 'private'}
-                                 ],
-                                 value=app_state['ip_type'],
-                                 style={'color': '#e0e0e0', 'fontSize': '12px'},
-                                 labelStyle={'marginRight': '10px', 'display': 'inline-block'})
-                ], style={'marginBottom': '8px'}),
+                    html.Div([
+                        html.Label(f"Visibility (auto-detected: {app_state['ip_type']}):", 
+                                  style={'color': '#e0e0e0', 'fontSize': '12px', 'display': 'block', 'marginBottom': '4px'}),
+                        dcc.RadioItems(id="visibility",
+                                     options=[
+                                         {'label': ' Public', 'value': 'public'},
+                                         {'label': ' Private', 'value': 'private'}
+                                     ],
+                                     value=app_state['ip_type'],
+                                     style={'color': '#e0e0e0', 'fontSize': '12px'},
+                                     labelStyle={'marginRight': '10px', 'display': 'inline-block'})
+                    ], style={'marginBottom': '8px'}),
                 
-                # Add cloud service selection
-                html.Div([
-                    html.Label("Cloud Service:", 
-                              style={'color': '#e0e0e0', 'fontSize': '12px', 'display': 'block', 'marginBottom': '4px'}),
-                    dcc.Dropdown(
-                        id="cloud-service",
-                        options=[
-                            {'label': 'APS (Default)', 'value': 'aps'},
-                            {'label': 'Imgur', 'value': 'imgur'},
-                            {'label': 'Globus', 'value': 'globus'}
-                        ],
-                        value='aps',  # Default to APS
-                        style={
-                            'backgroundColor': '#444', 
-                            'color': 'black',  # Text color for dropdown
-                            'border': '1px solid #666'
-                        },
-                        # Dropdown menu styling
-                        className='custom-dropdown'
-                    )
-                ])
-            ], style={'backgroundColor': '#333', 'padding': '10px', 'borderRadius': '5px', 'marginBottom': '10px'}),
+                    # Add cloud service selection
+                    html.Div([
+                        html.Label("Cloud Service:", 
+                                  style={'color': '#e0e0e0', 'fontSize': '12px', 'display': 'block', 'marginBottom': '4px'}),
+                        dcc.Dropdown(
+                            id="cloud-service",
+                            options=[
+                                {'label': 'APS (Default)', 'value': 'aps'},
+                                {'label': 'Imgur', 'value': 'imgur'},
+                                {'label': 'Globus', 'value': 'globus'}
+                            ],
+                            value='aps',  # Default to APS
+                            style={
+                                'backgroundColor': '#444', 
+                                'color': 'black',  # Text color for dropdown
+                                'border': '1px solid #666'
+                            },
+                            # Dropdown menu styling
+                            className='custom-dropdown'
+                        )
+                    ])
+                ], style={'backgroundColor': '#333', 'padding': '10px', 'borderRadius': '5px', 'marginBottom': '10px'}),
             
-            # Buttons
-            html.Div([
-                html.Button("Load Preview", id="preview-btn", n_clicks=0,
-                           style={'width': '48%', 'padding': '8px', 'margin': '1%', 'backgroundColor': '#007bff', 
-                                 'color': 'white', 'border': 'none', 'borderRadius': '4px', 'fontWeight': 'bold'}),
-                html.Button("Run tomolog", id="run-btn", n_clicks=0,
-                           style={'width': '48%', 'padding': '8px', 'margin': '1%', 'backgroundColor': '#28a745', 
-                                 'color': 'white', 'border': 'none', 'borderRadius': '4px', 'fontWeight': 'bold'}),
-                html.Button("Stop", id="stop-btn", n_clicks=0,
-                           style={'width': '98%', 'padding': '8px', 'margin': '1%', 'backgroundColor': '#dc3545', 
-                                 'color': 'white', 'border': 'none', 'borderRadius': '4px', 'fontWeight': 'bold'})
-            ], style={'textAlign': 'center'})
+                # Buttons
+                html.Div([
+                    html.Button("Load Preview", id="preview-btn", n_clicks=0,
+                               style={'width': '48%', 'padding': '8px', 'margin': '1%', 'backgroundColor': '#007bff', 
+                                     'color': 'white', 'border': 'none', 'borderRadius': '4px', 'fontWeight': 'bold'}),
+                    html.Button("Run tomolog", id="run-btn", n_clicks=0,
+                               style={'width': '48%', 'padding': '8px', 'margin': '1%', 'backgroundColor': '#28a745', 
+                                     'color': 'white', 'border': 'none', 'borderRadius': '4px', 'fontWeight': 'bold'}),
+                    html.Button("Stop", id="stop-btn", n_clicks=0,
+                               style={'width': '98%', 'padding': '8px', 'margin': '1%', 'backgroundColor': '#dc3545', 
+                                     'color': 'white', 'border': 'none', 'borderRadius': '4px', 'fontWeight': 'bold'})
+                ], style={'textAlign': 'center'})
             
-        ], style={'width': '25%', 'display': 'inline-block', 'verticalAlign': 'top', 'padding': '10px'}),
+            ], style={'width': '25%', 'display': 'inline-block', 'verticalAlign': 'top', 'padding': '10px'}),
         
-        # Middle column - Preview
-        html.Div([
-            html.Div(id="status", style={
-                'padding': '8px', 'backgroundColor': '#444', 'color': '#e0e0e0', 
-                'borderRadius': '4px', 'marginBottom': '10px', 'fontSize': '14px'
-            }),
-            
+            # Middle column - Preview
             html.Div([
-                html.H4("Image Preview (Draw ROI)", style={'color': '#e0e0e0', 'marginBottom': '8px'}),
-                html.Div(id="preview-container", style={'height': '400px'})
-            ])
+                html.Div(id="status", style={
+                    'padding': '8px', 'backgroundColor': '#444', 'color': '#e0e0e0', 
+                    'borderRadius': '4px', 'marginBottom': '10px', 'fontSize': '14px'
+                }),
             
-        ], style={'width': '40%', 'display': 'inline-block', 'verticalAlign': 'top', 'padding': '10px'}),
+                html.Div([
+                    html.H4("Image Preview (Draw ROI)", style={'color': '#e0e0e0', 'marginBottom': '8px'}),
+                    html.Div(id="preview-container", style={'height': '400px'})
+                ])
+            
+            ], style={'width': '40%', 'display': 'inline-block', 'verticalAlign': 'top', 'padding': '10px'}),
         
-        # Right column - Console
-        html.Div([
-            html.H4("Console Output", style={'color': '#e0e0e0', 'marginBottom': '10px'}),
+            # Right column - Console
+            html.Div([
+                html.H4("Console Output", style={'color': '#e0e0e0', 'marginBottom': '10px'}),
             
-            html.Pre(id="logs", style={
-                'backgroundColor': '#2d2d2d', 'color': '#e0e0e0', 'padding': '12px',
-                'borderRadius': '4px', 'fontSize': '12px', 'height': '420px',
-                'overflow': 'auto', 'fontFamily': 'monospace', 'margin': 0,
-                'border': '1px solid #444'
-            })
+                html.Pre(id="logs", style={
+                    'backgroundColor': '#2d2d2d', 'color': '#e0e0e0', 'padding': '12px',
+                    'borderRadius': '4px', 'fontSize': '12px', 'height': '420px',
+                    'overflow': 'auto', 'fontFamily': 'monospace', 'margin': 0,
+                    'border': '1px solid #444'
+                })
             
-        ], style={'width': '30%', 'display': 'inline-block', 'verticalAlign': 'top', 'padding': '10px'})
+            ], style={'width': '30%', 'display': 'inline-block', 'verticalAlign': 'top', 'padding': '10px'})
         
-    ], style={'height': '80vh'})
+        ], style={'height': '80vh'})
     
-], style={
-    'backgroundColor': '#1a1a1a', 'color': '#e0e0e0', 'minHeight': '100vh',
-    'fontFamily': 'system-ui, -apple-system, sans-serif', 'margin': 0, 'padding': 0
-})
+    ], style={
+        'backgroundColor': '#1a1a1a', 'color': '#e0e0e0', 'minHeight': '100vh',
+        'fontFamily': 'system-ui, -apple-system, sans-serif', 'margin': 0, 'padding': 0
+    })
+
+app.layout = serve_layout
 
 # Add CSS styling for the dropdown
 app.index_string = '''
@@ -578,6 +718,12 @@ app.index_string = '''
      Input('file-start', 'value')]
 )
 def update_slice_range(file_path, file_start):
+    # Skip re-firing for the same path (the initial page-load call always runs)
+    key = (file_path, file_start)
+    if dash.callback_context.triggered and key == app_state['slice_range_key']:
+        raise PreventUpdate
+    app_state['slice_range_key'] = key
+    
     slice_count = get_slice_count(file_path, file_start or 657)
     
     # Set reasonable marks
@@ -615,85 +761,88 @@ def update_file_range_display(start, count):
         return str(start), str(end), f"{count} files"
     return "—", "—", "0 files"
 
+def preview_title(preview_file, slice_val, min_intensity, max_intensity):
+    return (f"Preview: {os.path.basename(preview_file)}<br>Slice {slice_val} | "
+            f"Min: {min_intensity:.2f} Max: {max_intensity:.2f}<br>Draw rectangle to select ROI")
+
+def preview_image(data, min_intensity, max_intensity):
+    """go.Image properties showing the preview, quantized to 8 bits, for the given intensity window"""
+    # Apply intensity clipping for display
+    if max_intensity > min_intensity:
+        data_display = scale_intensity(data, min_intensity, max_intensity)
+    else:
+        data_display = data
+    app_state['preview_data'] = data_display
+    
+    # scale and cast in one pass, without a float temporary the size of the image
+    gray = np.empty(data_display.shape, dtype=np.uint8)
+    np.multiply(data_display, 255, out=gray, casting='unsafe')
+    if HAS_PIL:
+        # a grayscale PNG is a fraction of the size of the RGB z array once JSON-encoded
+        buf = io.BytesIO()
+        Image.fromarray(gray).save(buf, format='PNG', compress_level=1)
+        return {'source': 'data:image/png;base64,' + base64.b64encode(buf.getvalue()).decode()}
+    return {'z': np.dstack((gray, gray, gray))}
+
 # Preview callback
 @app.callback(
     [Output('preview-container', 'children'),
-     Output('roi-info', 'children')],
+     Output('roi-info', 'children'),
+     Output('preview-orig', 'data')],
     [Input('preview-btn', 'n_clicks'),
-     Input('slice-slider', 'value'),
-     Input('min-intensity', 'value'),
-     Input('max-intensity', 'value')],
-    [State('file-path', 'value'),
+     Input('slice-slider', 'value')],
+    [State('min-intensity', 'value'),
+     State('max-intensity', 'value'),
+     State('file-path', 'value'),
      State('file-start', 'value')]
 )
 def update_preview(preview_clicks, slice_val, min_intensity, max_intensity, file_path, file_start):
     ctx = dash.callback_context
     
-    # Check if we have cached preview data and only min/max changed
-    if (app_state.get('preview_data_original') is not None and 
-        ctx.triggered and 
-        any('intensity' in trigger['prop_id'] for trigger in ctx.triggered)):
-        
-        # Just update the intensity scaling on existing data
-        data = app_state['preview_data_original']  # Use original data
-        
-        # Apply new intensity clipping
-        if max_intensity > min_intensity:
-            data_display = np.clip((data - min_intensity) / (max_intensity - min_intensity), 0, 1)
-        else:
-            data_display = data
-        
-        app_state['preview_data'] = data_display
-        
-        # Get current preview file name
-        preview_file = app_state.get('preview_file', 'current file')
-        
+    # Load new preview (only when preview button clicked)
+    if not ctx.triggered or 'preview-btn' not in str(ctx.triggered):
+        return html.Div([
+            html.H4("Click 'Load Preview' to view image", style={'color': '#aaa', 'textAlign': 'center'}),
+            html.P("Preview not loaded for performance", style={'color': '#666', 'fontSize': '12px', 'textAlign': 'center'})
+        ], style={'padding': '20px'}), "No preview loaded", None
+    
+    # For preview, use the file_start number from the GUI instead of hardcoded 657
+    if '{}' in file_path:
+        preview_file = file_path.format(file_start or 657)  # Use actual file_start value
     else:
-        # Load new preview (only when preview button clicked or slice changed)
-        if not ctx.triggered or 'preview-btn' not in str(ctx.triggered):
-            return html.Div([
-                html.H4("Click 'Load Preview' to view image", style={'color': '#aaa', 'textAlign': 'center'}),
-                html.P("Preview not loaded for performance", style={'color': '#666', 'fontSize': '12px', 'textAlign': 'center'})
-            ], style={'padding': '20px'}), "No preview loaded"
-        
-        # For preview, use the file_start number from the GUI instead of hardcoded 657
-        if '{}' in file_path:
-            preview_file = file_path.format(file_start or 657)  # Use actual file_start value
-        else:
-            preview_file = file_path
-        
-        data = load_image_for_preview(preview_file, slice_val)
-        
-        if data is None:
-            return html.Div([
-                html.H4("No Preview Available", style={'color': '#ff6b6b', 'textAlign': 'center'}),
-                html.P("Check file path", style={'color': '#aaa', 'fontSize': '12px', 'textAlign': 'center'})
-            ], style={'padding': '20px'}), "No ROI selected"
-        
-        # Store original data for intensity updates
-        app_state['preview_data_original'] = data.copy()
-        app_state['preview_file'] = preview_file
-        
-        # Apply intensity clipping for display
-        if max_intensity > min_intensity:
-            data_display = np.clip((data - min_intensity) / (max_intensity - min_intensity), 0, 1)
-        else:
-            data_display = data
-        
-        app_state['preview_data'] = data_display
+        preview_file = file_path
+    
+    data = load_image_for_preview(preview_file, slice_val)
+    
+    if data is None:
+        return html.Div([
+            html.H4("No Preview Available", style={'color': '#ff6b6b', 'textAlign': 'center'}),
+            html.P("Check file path", style={'color': '#aaa', 'fontSize': '12px', 'textAlign': 'center'})
+        ], style={'padding': '20px'}), "No ROI selected", None
+    
+    app_state['preview_file'] = preview_file
+    app_state['preview_version'] += 1
+    
+    # Normalized slice for the browser-side intensity windowing, 16 bits so narrow windows keep their levels
+    preview_orig = {
+        'version': app_state['preview_version'],
+        'name': os.path.basename(preview_file),
+        'slice': slice_val,
+        'height': data.shape[0],
+        'width': data.shape[1],
+        'pixels': base64.b64encode(np.rint(data * 65535).astype('<u2').tobytes()).decode(),
+    }
     
     fig = go.Figure()
     
-    # Add image
-    fig.add_trace(go.Heatmap(
-        z=data_display,
-        colorscale='Greys',
-        showscale=True,
-        hovertemplate='x: %{x}<br>y: %{y}<br>value: %{z}<extra></extra>'
+    # Add image: an 8-bit gray RGB raster is drawn as one bitmap instead of per-cell heatmap shapes
+    fig.add_trace(go.Image(
+        **preview_image(data, min_intensity, max_intensity),
+        hovertemplate='x: %{x}<br>y: %{y}<extra></extra>'
     ))
     
     fig.update_layout(
-        title=f"Preview: {os.path.basename(preview_file)}<br>Slice {slice_val} | Min: {min_intensity:.2f} Max: {max_intensity:.2f}<br>Draw rectangle to select ROI",
+        title=preview_title(preview_file, slice_val, min_intensity, max_intensity),
         height=400,
         width=400,
         template="plotly_dark",
@@ -728,7 +877,62 @@ def update_preview(preview_clicks, slice_val, min_intensity, max_intensity, file
     
     roi_text = "Draw rectangle on image to select ROI (applies to all files)"
     
-    return graph, roi_text
+    return graph, roi_text, preview_orig
+
+# Intensity sliders only re-window the loaded preview: done in the browser, no server round trip
+app.clientside_callback(
+    """
+    function(minIntensity, maxIntensity, stored, figure) {
+        const noUpdate = window.dash_clientside.no_update;
+        if (!stored || !figure || minIntensity === null || maxIntensity === null) {
+            return noUpdate;
+        }
+        // decode the 16-bit slice once per loaded preview
+        let cache = window.tomologPreview;
+        if (!cache || cache.version !== stored.version) {
+            const raw = atob(stored.pixels);
+            const bytes = new Uint8Array(raw.length);
+            for (let i = 0; i < raw.length; i++) {
+                bytes[i] = raw.charCodeAt(i);
+            }
+            const canvas = document.createElement('canvas');
+            canvas.width = stored.width;
+            canvas.height = stored.height;
+            cache = {version: stored.version, pixels: new Uint16Array(bytes.buffer), canvas: canvas};
+            window.tomologPreview = cache;
+        }
+        let lo = 0, scale = 255 / 65535;
+        if (maxIntensity > minIntensity) {
+            lo = minIntensity * 65535;
+            scale = 255 / ((maxIntensity - minIntensity) * 65535);
+        }
+        const ctx = cache.canvas.getContext('2d');
+        const image = ctx.createImageData(stored.width, stored.height);
+        const out = image.data, pixels = cache.pixels;
+        for (let i = 0; i < pixels.length; i++) {
+            const v = Math.max(0, Math.min(255, (pixels[i] - lo) * scale));
+            out[4 * i] = out[4 * i + 1] = out[4 * i + 2] = v;
+            out[4 * i + 3] = 255;
+        }
+        ctx.putImageData(image, 0, 0);
+
+        const trace = Object.assign({}, figure.data[0], {source: cache.canvas.toDataURL('image/png')});
+        delete trace.z;
+        const title = 'Preview: ' + stored.name + '<br>Slice ' + stored.slice +
+            ' | Min: ' + minIntensity.toFixed(2) + ' Max: ' + maxIntensity.toFixed(2) +
+            '<br>Draw rectangle to select ROI';
+        const layout = Object.assign({}, figure.layout,
+                                     {title: Object.assign({}, figure.layout.title, {text: title})});
+        return Object.assign({}, figure, {data: [trace], layout: layout});
+    }
+    """,
+    Output('preview-graph', 'figure'),
+    [Input('min-intensity', 'value'),
+     Input('max-intensity', 'value')],
+    [State('preview-orig', 'data'),
+     State('preview-graph', 'figure')],
+    prevent_initial_call=True
+)
 
 @app.callback(
     Output('roi-info', 'children', allow_duplicate=True),
@@ -754,15 +958,30 @@ def update_roi(relayout_data):
     
     return "No ROI selected"
 
-# Real-time log updates
+# Real-time log updates: polled while tomolog runs, and after preview loads which also log
 @app.callback(
     [Output('logs', 'children'),
-     Output('status', 'children')],
-    [Input('interval-component', 'n_intervals')]
+     Output('status', 'children'),
+     Output('logs-version', 'data'),
+     Output('interval-component', 'disabled', allow_duplicate=True)],
+    [Input('interval-component', 'n_intervals'),
+     Input('roi-info', 'children'),
+     Input('slice-info', 'children')],
+    [State('logs-version', 'data')],
+    prevent_initial_call='initial_duplicate'
 )
-def update_logs_realtime(n_intervals):
-    logs_text = '\n'.join(app_state['logs'][-30:]) if app_state['logs'] else 'Ready to run tomolog'
-    return logs_text, app_state['status']
+def update_logs_realtime(n_intervals, roi_info, slice_info, sent_version):
+    # read before the logs: once the run thread has cleared this, its last lines are queued
+    disabled = not app_state['process_running']
+    # copy under the lock: iterating a deque while the run thread appends raises RuntimeError
+    with log_lock:
+        _flush_pending_logs()
+        version = [app_state['logs_version'], app_state['status']]
+        if version == sent_version:
+            return dash.no_update, dash.no_update, dash.no_update, disabled
+        logs = list(app_state['logs'])[-30:]
+    logs_text = '\n'.join(logs) if logs else 'Ready to run tomolog'
+    return logs_text, version[1], version, disabled
 
 # Button handlers
 @app.callback(
@@ -803,6 +1022,8 @@ def handle_buttons(run_clicks, stop_clicks, file_template, file_start, file_coun
                 
                 file_list = generate_file_list(file_template, file_start or 1, file_count or 1)
                 add_log(f"Starting tomolog on {len(file_list)} files with {cloud_service} cloud service")
+                # set before the thread starts so the first log tick does not disable the interval
+                app_state['process_running'] = True
                 thread = threading.Thread(target=run_tomolog_cli, args=(params,))
                 thread.daemon = True
                 thread.start()
@@ -819,9 +1040,10 @@ def handle_buttons(run_clicks, stop_clicks, file_template, file_start, file_coun
             app_state['process_running'] = False
             app_state['current_process'] = None
     
-    return False  # Keep interval enabled
+    # Enable polling; update_logs_realtime disables it again once tomolog is idle and its logs are shown
+    return False
 
-if __name__ == "__main__":
+def main():
     print("Starting Tomolog Interface...")
     print("Available at: http://localhost:9000")
     
@@ -834,3 +1056,6 @@ if __name__ == "__main__":
         except Exception as e2:
             print(f"Port 9001 failed: {e2}")
             app.run(debug=False, host="127.0.0.1", port=9002)
+
+if __name__ == "__main__":
+    main()
@@ -47,15 +47,18 @@ import os
 import uuid
 import pathlib
 import datetime
+import functools
 import yaml
 import h5py
+import matplotlib
+matplotlib.use('Agg')  # use non-GUI backend before importing pyplot
 import matplotlib.pyplot as plt
 import numpy as np
 
 from matplotlib_scalebar.scalebar import ScaleBar
 from mpl_toolkits.axes_grid1 import make_axes_locatable
-from threading import Thread
 from ast import literal_eval
+from concurrent.futures import ThreadPoolExecutor
 
 import meta
 
@@ -72,11 +75,24 @@ __all__ = ['TomoLog', ]
 # Temporary local files to be uploaded to the url service. Google API retrieves images by url before publishing on slides
 FILE_NAME_PROJ  = 'projection'
 FILE_NAME_RECON = 'reconstruction'
+# JPEG encoder settings for the uploaded figures: quality 85 is visually lossless on grayscale
+# slices and about half the size of the matplotlib default
+JPEG_OPTIONS = {'quality': 85, 'optimize': True, 'progressive': True}
 
 # Credentials of the Google service that will create the slides
 # For details see: https://tomologcli.readthedocs.io/en/latest/source/install.html#google
 GOOGLE_TOKEN = os.path.join(str(pathlib.Path.home()), 'tokens', 'google_token.json')
 
+# Projection figures, keyed by colorbar format, reused for every data set logged by this process
+_PROJECTION_PLOTS = {}
+# Reconstruction figure and its panels, built on the first plot_recon call and reused after that
+_RECON_PLOT = {}
+
+@functools.lru_cache(maxsize=None)
+def _compile_meta_item(template):
+    # the description templates are fixed strings: compile each f-string once per process
+    return compile(f"f'{template}'", '<meta item>', 'eval')
+
 class TomoLog():
     '''
     Class to publish experiment meta data, tomography projection and reconstruction on a 
@@ -113,27 +129,29 @@ class TomoLog():
 
     def publish_descr(self, presentation_id, page_id):
         # add here beamline independent bullets
-        descr = self.read_meta_item(
-            "File name: {os.path.basename(self.meta[self.full_file_name_key][0])}")
-        descr += self.read_meta_item(
-            "Beamline: {self.meta[self.beamline_key][0]} {self.meta[self.instrument_key][0]}")
-        descr += self.read_meta_item(
-            "Scan date: {self.meta[self.date_key][0]}")
-        descr += self.read_meta_item(
-            "Exposure time: {self.meta[self.exposure_time_key][0]:.05f} {self.meta[self.exposure_time_key][1]}")
-        descr += self.read_meta_item(
-            "Camera pixel size: {self.meta[self.pixel_size_key][0]:.02f} {self.meta[self.pixel_size_key][1]}")
-        descr += self.read_meta_item(
-            "Lens magnification: {self.meta[self.magnification_key][0]}")
-        descr += self.read_meta_item(
-            "Projection pixel size: {self.meta[self.resolution_key][0]:.02f} {self.meta[self.resolution_key][1]}")
-        descr += self.read_meta_item(
-            "Angle step: {self.meta[self.angle_step_key][0]:.03f} {self.meta[self.angle_step_key][1]}")
         self.rotation_end = self.meta[self.rotation_start_key][0] + (self.meta[self.num_angle_key][0] * self.meta[self.angle_step_key][0]) - self.meta[self.angle_step_key][0]
-        descr += self.read_meta_item(
-            "Number of angles: {self.meta[self.num_angle_key][0]} ({self.meta[self.rotation_start_key][0]:.02f} - {self.rotation_end:.02f})")
-        descr += self.read_meta_item(
-            "Projection size: {int(self.meta[self.width_key][0])} x {int(self.meta[self.height_key][0])}")
+        descr = ''.join([
+            self.read_meta_item(
+                "File name: {os.path.basename(self.meta[self.full_file_name_key][0])}"),
+            self.read_meta_item(
+                "Beamline: {self.meta[self.beamline_key][0]} {self.meta[self.instrument_key][0]}"),
+            self.read_meta_item(
+                "Scan date: {self.meta[self.date_key][0]}"),
+            self.read_meta_item(
+                "Exposure time: {self.meta[self.exposure_time_key][0]:.05f} {self.meta[self.exposure_time_key][1]}"),
+            self.read_meta_item(
+                "Camera pixel size: {self.meta[self.pixel_size_key][0]:.02f} {self.meta[self.pixel_size_key][1]}"),
+            self.read_meta_item(
+                "Lens magnification: {self.meta[self.magnification_key][0]}"),
+            self.read_meta_item(
+                "Projection pixel size: {self.meta[self.resolution_key][0]:.02f} {self.meta[self.resolution_key][1]}"),
+            self.read_meta_item(
+                "Angle step: {self.meta[self.angle_step_key][0]:.03f} {self.meta[self.angle_step_key][1]}"),
+            self.read_meta_item(
+                "Number of angles: {self.meta[self.num_angle_key][0]} ({self.meta[self.rotation_start_key][0]:.02f} - {self.rotation_end:.02f})"),
+            self.read_meta_item(
+                "Projection size: {int(self.meta[self.width_key][0])} x {int(self.meta[self.height_key][0])}"),
+        ])
         if (self.args.beamline == "None"):
             descr = descr[:-1]
             self.google_slide.create_textbox_with_bullets(
@@ -159,56 +177,68 @@ class TomoLog():
             dirname = os.path.dirname(self.args.file_name)
             with open(f'{dirname}_rec/{basename}_rec/rec_line.txt', 'r') as fid:
                 line = fid.readlines()[0]
-        except:
+        except (OSError, IndexError):
             log.warning('Skipping the command line for reconstruction')
             line = ''
         return line
 
     def run_log(self):
-        # read meta, calculate resolutions
-        mp = meta.read_meta.Hdf5MetadataReader(self.args.file_name)
-        self.meta = mp.readMetadata()
-        mp.close()
-
-        if (self.meta[self.sample_in_x_key][0] != 0) and self.args.beamline == '2-bm':
-            self.double_fov = True
-            log.warning('Sample in x is off center: %s. Handling the data set as a double FOV' %
-                        self.meta[self.sample_in_x_key][0])
-
-        if (self.meta[self.sample_in_x_key][0] != 0) and self.args.beamline == '7-bm':
-            log.warning('Sample in x is off center: %s. Assume rotation axis was not zeroed' %
-                        self.meta[self.sample_in_x_key][0])
-
-        # Option to overwrite the values of the pixel size and resolution stored h5 if missing or incorrect
-        if self.args.pixel_size!=-1:
-            self.meta[self.pixel_size_key][0]  = self.args.pixel_size
-        if self.args.magnification!=-1:
-            self.meta[self.magnification_key][0]  = f'{self.args.magnification}x'
-        if self.args.magnification!=-1 and self.args.pixel_size!=-1:
-            self.meta[self.resolution_key][0]  = self.args.pixel_size/self.args.magnification
-        
-        self.mct_resolution = float(self.meta[self.pixel_size_key][0]) / float(self.meta[self.magnification_key][0].lower().replace("x", ""))
-
-        
+        # open the raw file once for the metadata and the projections: the metadata reader opens
+        # the same file and HDF5 hands it the already open one. The file is closed again as soon
+        # as the projections are in memory, before the slow plotting and uploading
+        with h5py.File(self.args.file_name, 'r') as fid:
+            # read meta, calculate resolutions
+            mp = meta.read_meta.Hdf5MetadataReader(self.args.file_name)
+            self.meta = mp.readMetadata()
+            mp.close()
+
+            sample_in_x = self.meta[self.sample_in_x_key][0] if self.sample_in_x_key in self.meta else 0
+            if (sample_in_x != 0) and self.args.beamline == '2-bm':
+                self.double_fov = True
+                log.warning('Sample in x is off center: %s. Handling the data set as a double FOV' %
+                            sample_in_x)
+
+            if (sample_in_x != 0) and self.args.beamline == '7-bm':
+                log.warning('Sample in x is off center: %s. Assume rotation axis was not zeroed' %
+                            sample_in_x)
+
+            # Option to overwrite the values of the pixel size and resolution stored h5 if missing or incorrect
+            if self.args.pixel_size!=-1:
+                self.meta[self.pixel_size_key][0]  = self.args.pixel_size
+            if self.args.magnification!=-1:
+                self.meta[self.magnification_key][0]  = f'{self.args.magnification}x'
+            if self.args.magnification!=-1 and self.args.pixel_size!=-1:
+                self.meta[self.resolution_key][0]  = self.args.pixel_size/self.args.magnification
+
+            self.mct_resolution = float(self.meta[self.pixel_size_key][0]) / float(self.meta[self.magnification_key][0].lower().replace("x", ""))
+
+            proj = self.read_raw(fid)
+
+        # collect the slide content and send it to google in one batchUpdate at the end
+        self.google_slide.begin_batch()
         presentation_id, page_id = self.init_slide()
-        self.save_history(self.args.presentation_url)
-        self.publish_descr(presentation_id, page_id)
-        self.publish_note(presentation_id, page_id)
-        proj = self.read_raw()
-        self.publish_proj(presentation_id, page_id, proj)
-        recon = self.read_recon()
-        #print(recon)
-        self.publish_recon(presentation_id, page_id, recon)
+        try:
+            self.save_history(self.args.presentation_url)
+            self.publish_descr(presentation_id, page_id)
+            self.publish_note(presentation_id, page_id)
+            # read the reconstruction slices from disk while the projection is plotted and uploaded
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                recon_future = executor.submit(self.read_recon)
+                self.publish_proj(presentation_id, page_id, proj)
+                recon = recon_future.result()
+            #print(recon)
+            self.publish_recon(presentation_id, page_id, recon)
+        finally:
+            self.google_slide.flush_batch(presentation_id)
 
     def init_slide(self):
         # create a slide and publish file name
         file_name = os.path.basename(self.args.file_name)
-        try:
-            presentation_id = self.args.presentation_url.split('/')[-2]
-        except AttributeError:
+        if self.args.presentation_url is None:
             log.error(
                 "Set --presentation-url to point to a valid Google slide location")
             exit()
+        presentation_id = self.args.presentation_url.split('/')[-2]
         # Create a new Google slide
         page_id = str(uuid.uuid4())
         self.google_slide.create_slide(presentation_id, page_id)
@@ -242,18 +272,17 @@ class TomoLog():
 
     def read_meta_item(self, template):
         try:
-            str = eval(f"f'{template}'")+"\n"
+            str = eval(_compile_meta_item(template))+"\n"
         except:
             log.warning(f'meta item missing: {template}')
             str = ""
         return str
 
-    def read_raw(self):
+    def read_raw(self, fid):
         log.info('Reading CT projection')
         proj = []
-        with h5py.File(self.args.file_name) as fid:
-            data = fid['exchange/data'][0][:]
-            proj.append(data)
+        data = utils.read_frame(fid['exchange/data'])
+        proj.append(data)
         return proj
 
     def read_recon(self):
@@ -265,7 +294,7 @@ class TomoLog():
 
         if self.args.save_format == 'h5':
             fname  = os.path.dirname(self.args.file_name)+'_rec/'+os.path.basename(self.args.file_name)[:-3]+'_rec.h5'
-            with h5py.File(fname,'r') as fid:
+            with h5py.File(fname,'r', **utils.H5_RECON_CACHE) as fid:
                 data = fid['exchange/recon']
                 h,w = data.shape[:2]
                 if self.args.idz == -1:
@@ -289,20 +318,26 @@ class TomoLog():
                 rec_prefix = 'recon'
 
                 top = os.path.join(dirname+'_rec', basename+'_rec')
-                tiff_file_list = sorted(
-                    list(filter(lambda x: x.endswith(('.tif', '.tiff')), os.listdir(top))))
-                z_start = int(tiff_file_list[0].split('.')[0].split('_')[1])
-                z_end = int(tiff_file_list[-1].split('.')[0].split('_')[1]) + 1
+                if not os.path.isdir(top):
+                    log.error('Reconstructions for %s are missing. Please run the recontruction.' % top)
+                    log.warning('Skipping reconstruction')
+                    return recon
+                tiff_file_list = utils.recon_tiff_bounds(top)
+                z_start, z_end = utils.recon_slice_range(tiff_file_list)
                 height = z_end-z_start
                 fname_tmp = os.path.join(top, tiff_file_list[0])
                 # take size
-                tmp = utils.read_tiff(fname_tmp).copy()
+                tmp_shape = utils.read_tiff_shape(fname_tmp)
 
                 if self.double_fov == True:
                     width = width * 2
                     binning_rec = 1
                 else:
-                    binning_rec = width//tmp.shape[0]
+                    binning_rec = width//tmp_shape[0]
+                    if binning_rec == 0:
+                        log.error('Reconstructions for %s are larger than raw data image width. This is the case in a 0-360. Please use: --double-fov' % top)
+                        log.warning('Skipping reconstruction')
+                        return recon
 
                 w = width//binning_rec
                 h = height
@@ -314,69 +349,79 @@ class TomoLog():
                     self.args.idx = int(w//2)-int(w//32)
 
                 z = utils.read_tiff(
-                    f'{dirname}_rec/{basename}_rec/{rec_prefix}_{self.args.idz:05}.tiff').copy()
+                    f'{dirname}_rec/{basename}_rec/{rec_prefix}_{self.args.idz:05}.tiff')
+                if z is False:
+                    raise FileNotFoundError(f'slice {self.args.idz} not found')
                 
                 # read x,y slices by lines
-                y = np.zeros((h, w), dtype='float32')
-                x = np.zeros((h, w), dtype='float32')
-
-                nthreads = 8
-                threads = []
-                lchunk = int(np.ceil((z_end-z_start)/nthreads))
-                lchunk = np.minimum(lchunk, np.int32(z_end-z_start-np.arange(nthreads)*lchunk))  # chunk sizes
-                for k in range(nthreads):
-                    read_proc = Thread(target=utils.read_tiff_part, args=(self.args, f'{dirname}_rec/{basename}_rec/{rec_prefix}', x, y, z_start, k*lchunk[0], lchunk[k]))
-                    threads.append(read_proc)
-                    read_proc.start()
-                for th in threads:
-                    th.join()
+                # every row is written by read_tiff_lines, which raises if a slice cannot be read
+                y = np.empty((h, w), dtype='float32')
+                x = np.empty((h, w), dtype='float32')
+
+                utils.read_tiff_lines(f'{dirname}_rec/{basename}_rec/{rec_prefix}', z_start,
+                                      x, y, self.args.idx, self.args.idy)
                 
                 recon = [x, y, z]
 
                 self.binning_rec = binning_rec
-            except ZeroDivisionError:
-                log.error('Reconstructions for %s are larger than raw data image width. This is the case in a 0-360. Please use: --double-fov' % top)
-                log.warning('Skipping reconstruction')
             except FileNotFoundError:
                 log.error('Reconstructions for %s are missing. Please run the recontruction.' % top)
                 log.warning('Skipping reconstruction')
-            except:
+            except (IndexError, OSError, ValueError):
                 log.warning('Skipping reconstruction')
         
         return recon
 
 
-    def plot_projection(self, proj, fname):
-        log.info('Plot microCT projection')
+    def plot_projection(self, proj, fname, resolution=None, colorbar_format='%.1e'):
+        log.info('Plot projection')
         # auto-adjust colorbar values according to a histogram
-        mmin, mmax = utils.find_min_max(proj)
-        proj[proj > mmax] = mmax
-        proj[proj < mmin] = mmin
-
-        # plot
-        fig = plt.figure(constrained_layout=True, figsize=(6, 4))
-        ax = fig.add_subplot()
-        im = ax.imshow(proj, cmap='gray')
-        # Create scale bar
-        scalebar = ScaleBar(self.mct_resolution, "um", length_fraction=0.25)
-        ax.add_artist(scalebar)
-        divider = make_axes_locatable(ax)
-        cax = divider.append_axes("right", size="5%", pad=0.1)
-        plt.colorbar(im, cax=cax, format='%.1e')
-        plt.savefig(fname, bbox_inches='tight', pad_inches=0, dpi=300)
-        plt.cla()
-        plt.close(fig)
+        mmin, mmax = utils.find_min_max_fast(proj)
+        # one pass; unsafe casting keeps integer projections clipped in place
+        np.clip(proj, mmin, mmax, out=proj, casting='unsafe')
+        if resolution is None:
+            resolution = self.mct_resolution
+        # the saved figure is about 900 pixels wide: average the projection down to
+        # at most twice that here rather than have imshow resample the full frame
+        step = utils.plot_stride(proj.shape, 1024)
+        if step > 1:
+            proj = utils.bin_image(proj, step)
+            resolution = resolution * step
+
+        # plot: build the figure once, then only swap the image data and scale
+        plot = _PROJECTION_PLOTS.get(colorbar_format)
+        if plot is None:
+            fig = plt.figure(constrained_layout=True, figsize=(6, 4))
+            ax = fig.add_subplot()
+            # fixed color limits: block means need not reach the clipped extremes
+            im = ax.imshow(proj, cmap='gray', vmin=mmin, vmax=mmax)
+            # Create scale bar
+            scalebar = ScaleBar(resolution, "um", length_fraction=0.25)
+            ax.add_artist(scalebar)
+            divider = make_axes_locatable(ax)
+            cax = divider.append_axes("right", size="5%", pad=0.1)
+            fig.colorbar(im, cax=cax, format=colorbar_format)
+            _PROJECTION_PLOTS[colorbar_format] = fig, im, scalebar
+        else:
+            fig, im, scalebar = plot
+            im.set_data(proj)
+            im.set_extent((-0.5, proj.shape[1] - 0.5, proj.shape[0] - 0.5, -0.5))
+            im.set_clim(mmin, mmax)
+            scalebar.dx = resolution
+        fig.savefig(fname, bbox_inches='tight', pad_inches=0, dpi=150, pil_kwargs=JPEG_OPTIONS)
 
     def plot_recon(self, recon, fname):
         log.info('Plot reconstruction')
-        fig = plt.figure(constrained_layout=True, figsize=(14, 12))
-        grid = fig.add_gridspec(3, 3, height_ratios=[1, 1, 1])
+        if not _RECON_PLOT:
+            _RECON_PLOT['fig'] = fig = plt.figure(constrained_layout=True, figsize=(14, 12))
+            _RECON_PLOT['grid'] = fig.add_gridspec(3, 3, height_ratios=[1, 1, 1])
+            _RECON_PLOT['panels'] = {}
+        fig, grid, panels = _RECON_PLOT['fig'], _RECON_PLOT['grid'], _RECON_PLOT['panels']
         slices = ['x', 'y', 'z']
         # autoadjust colorbar values according to a histogram
 
         if self.args.min == self.args.max:
-            self.args.min, self.args.max = utils.find_min_max(
-                np.concatenate(recon))
+            self.args.min, self.args.max = utils.find_min_max_fast(recon)
 
         sl = [self.args.idx, self.args.idy, self.args.idz]
         tmp = literal_eval(self.args.zoom)
@@ -388,28 +433,33 @@ class TomoLog():
         for j in range(3):
             for k in range(3):
                 [s0,s1] = recon[k].shape
-                recon0 = recon[k][s0//2-s0//2//zooms[j]:s0//2+s0//2//zooms[j],s1//2-s1//2//zooms[j]:s1//2+s1//2//zooms[j]]
-                
-                recon0[0, 0] = self.args.max
-                recon0[0, 1] = self.args.min
-                recon0[recon0 > self.args.max] = self.args.max
-                recon0[recon0 < self.args.min] = self.args.min
-                ax = fig.add_subplot(grid[3*k+j])
-                im = ax.imshow(recon0, cmap='gray')
-                # Create scale bar
-                scalebar = ScaleBar(self.mct_resolution *
-                                    self.binning_rec, "um", length_fraction=0.25)
-                ax.add_artist(scalebar)
-                divider = make_axes_locatable(ax)
-                cax = divider.append_axes("right", size="5%", pad=0.1)
-                cb = plt.colorbar(im, cax=cax)
-                if j<2:
-                    cb.remove()
+                # a panel is about 600 pixels wide in the saved figure: skip the pixels it cannot show
+                st = utils.plot_stride((s0//zooms[j], s1//zooms[j]), 1024)
+                recon0 = recon[k][s0//2-s0//2//zooms[j]:s0//2+s0//2//zooms[j]:st,s1//2-s1//2//zooms[j]:s1//2+s1//2//zooms[j]:st]
+                if (j, k) not in panels:
+                    ax = fig.add_subplot(grid[3*k+j])
+                    # the colormap saturates outside [vmin, vmax]: no need to clip or edit the slice
+                    im = ax.imshow(recon0, cmap='gray', vmin=self.args.min, vmax=self.args.max)
+                    # Create scale bar
+                    scalebar = ScaleBar(self.mct_resolution *
+                                        self.binning_rec * st, "um", length_fraction=0.25)
+                    ax.add_artist(scalebar)
+                    divider = make_axes_locatable(ax)
+                    cax = divider.append_axes("right", size="5%", pad=0.1)
+                    cb = fig.colorbar(im, cax=cax)
+                    if j<2:
+                        cb.remove()
+                    panels[j, k] = ax, im, scalebar
+                else:
+                    # swap the slice and the scales; the colorbar follows the image limits
+                    ax, im, scalebar = panels[j, k]
+                    im.set_data(recon0)
+                    im.set_extent((-0.5, recon0.shape[1] - 0.5, recon0.shape[0] - 0.5, -0.5))
+                    im.set_clim(self.args.min, self.args.max)
+                    scalebar.dx = self.mct_resolution * self.binning_rec * st
                 if j==0:
                     ax.set_ylabel(f'slice {slices[k]}={sl[k]}', fontsize=18)
-        plt.savefig(fname, bbox_inches='tight', pad_inches=0, dpi=150)
-        plt.cla()
-        plt.close(fig)
+        fig.savefig(fname, bbox_inches='tight', pad_inches=0, dpi=150, pil_kwargs=JPEG_OPTIONS)
 
     def publish_proj(self, presentation_id, page_id, proj, resolution=1):
         self.google_slide.create_textbox_with_text(
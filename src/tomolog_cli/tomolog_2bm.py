@@ -43,24 +43,17 @@
 # POSSIBILITY OF SUCH DAMAGE.                                             #
 # #########################################################################
 
-import os
-import meta
-import h5py
-import numpy as np
 import matplotlib
 matplotlib.use('Agg')  # use non-GUI backend before importing pyplot
 import matplotlib.pyplot as plt
 
-from matplotlib_scalebar.scalebar import ScaleBar
-from mpl_toolkits.axes_grid1 import make_axes_locatable
 from datetime import datetime
 
-import requests
-
 from tomolog_cli import utils
 from tomolog_cli import log
 from tomolog_cli import TomoLog
 from tomolog_cli import cloud
+from tomolog_cli.tomolog import JPEG_OPTIONS
 
 __author__ = "Viktor Nikitin,  Francesco De Carlo"
 __copyright__ = "Copyright (c) 2022, UChicago Argonne, LLC."
@@ -97,12 +90,14 @@ class TomoLog2BM(TomoLog):
         descr = super().publish_descr(presentation_id, page_id)
         
         # add here beamline specific bullets
-        descr += self.read_meta_item(
-            "Scan energy: {self.meta[self.energy_key][0]} {self.meta[self.energy_key][1]}")
-        descr += self.read_meta_item(
-            "Sample Y: {self.meta[self.sample_y_key][0]:.02f} {self.meta[self.sample_y_key][1]}")
-        descr += self.read_meta_item(
-            "Propagation dist.: {self.meta[self.propogation_distance_key][0]:.02f} {self.meta[self.propogation_distance_key][1]}")
+        items = [
+            self.read_meta_item(
+                "Scan energy: {self.meta[self.energy_key][0]} {self.meta[self.energy_key][1]}"),
+            self.read_meta_item(
+                "Sample Y: {self.meta[self.sample_y_key][0]:.02f} {self.meta[self.sample_y_key][1]}"),
+            self.read_meta_item(
+                "Propagation dist.: {self.meta[self.propogation_distance_key][0]:.02f} {self.meta[self.propogation_distance_key][1]}"),
+        ]
         # descr += self.read_meta_item(
         #     "Eurotherm 1: {self.meta[self.eurotherm1_key][0]:.05f} {self.meta[self.eurotherm1_key][1]}")
         # descr += self.read_meta_item(
@@ -119,31 +114,27 @@ class TomoLog2BM(TomoLog):
             if pitch_angle != 0:
                 pitch_angle = -pitch_angle
                 pitch_angle_units = self.read_meta_item("{self.meta[self.sample_pitch_angle_key][1]}")
-                descr += "Pitch angle: " + str(pitch_angle) + pitch_angle_units
+                items.append(f"Pitch angle: {pitch_angle}{pitch_angle_units}")
         current_datetime = datetime.now()
         current_time_str = current_datetime.strftime("%H:%M:%S")
-        descr += F"Current time: {current_time_str}"
+        items.append(F"Current time: {current_time_str}")
+        descr += ''.join(items)
         # descr = descr[:-1]
         self.google_slide.create_textbox_with_bullets(
             presentation_id, page_id, descr, 240, 120, 0, 18, 8, 0)
 
-    def read_raw(self):
+    def read_raw(self, fid):
         log.info('Reading microCT projection')
         proj = []
-        with h5py.File(self.args.file_name) as fid:
-            if self.double_fov == True:
-                log.warning('Data read: Handling the data set as a double FOV')
-                image_0 = np.flip(fid['exchange/data'][0][:], axis=1)
-                image_1 = fid['exchange/data'][-1][:]
-                data = np.hstack((image_0, image_1))
-            else:
-                data = fid['exchange/data'][0][:]
-            proj.append(data)
-            try:
-                proj.append(fid['exchange/web_camera_frame'][:])
-                log.info('Reading camera frame')
-            except:
-                pass
+        if self.double_fov == True:
+            log.warning('Data read: Handling the data set as a double FOV')
+            data = utils.read_double_fov(fid['exchange/data'])
+        else:
+            data = utils.read_frame(fid['exchange/data'])
+        proj.append(data)
+        if 'exchange/web_camera_frame' in fid:
+            proj.append(utils.read_dataset(fid['exchange/web_camera_frame']))
+            log.info('Reading camera frame')
         return proj
 
     def publish_proj(self, presentation_id, page_id, proj):
@@ -151,20 +142,28 @@ class TomoLog2BM(TomoLog):
         self.google_slide.create_textbox_with_text(
             presentation_id, page_id, 'Micro-CT projection', 90, 20, 50, 170, 8, 0)
         self.plot_projection(proj[0], self.file_name_proj0)
-        proj_url = cloud.upload(self.args, self.file_name_proj0)
+        # upload the projection while the web camera frame is plotted
+        proj_upload = cloud.upload_async(self.args, self.file_name_proj0)
+        if len(proj) > 1:
+            log.info('Plotting web camera image')
+            # own figure: the projection figure is kept open and reused by plot_projection
+            fig = plt.figure()
+            ax = fig.add_subplot()
+            # the camera stores BGR: show it through a reversed channel view, no copy
+            ax.imshow(proj[1][..., ::-1])
+            ax.axis('off')
+            fig.savefig(self.file_name_webcam,dpi=300, pil_kwargs=JPEG_OPTIONS)
+            plt.close(fig)
+            webcam_upload = cloud.upload_async(self.args, self.file_name_webcam)
         log.info('Publish microCT projection')
         self.google_slide.create_image(
-            presentation_id, page_id, proj_url, 120, 120, 30, 180)
-        try:
+            presentation_id, page_id, proj_upload.result(), 120, 120, 30, 180)
+        if len(proj) > 1:
             self.google_slide.create_textbox_with_text(
                 presentation_id, page_id, 'Frame from the IP camera in the hutch', 160, 20, 10, 290, 8, 0)
-            log.info('Plotting web camera image')
-            plt.imshow(np.fliplr(proj[1].reshape(-1,3)).reshape(proj[1].shape))
-            plt.axis('off')
-            plt.savefig(self.file_name_webcam,dpi=300)
-            webcam_url = cloud.upload(self.args, self.file_name_webcam)
+            webcam_url = webcam_upload.result()
             log.info('Publish web camera image')
             self.google_slide.create_image(
                 presentation_id, page_id, webcam_url, 170, 170, 0, 270)
-        except:
+        else:
             log.warning('No frame from the IP camera')
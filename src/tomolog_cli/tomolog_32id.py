@@ -44,9 +44,6 @@
 # #########################################################################
 
 import os
-import uuid
-import pathlib
-import meta
 import h5py
 import numpy as np
 import matplotlib
@@ -59,6 +56,7 @@ from tomolog_cli import utils
 from tomolog_cli import log
 from tomolog_cli import TomoLog
 from tomolog_cli import cloud
+from tomolog_cli.tomolog import JPEG_OPTIONS
 
 __author__ = "Viktor Nikitin,  Francesco De Carlo"
 __copyright__ = "Copyright (c) 2022, UChicago Argonne, LLC."
@@ -67,6 +65,9 @@ __all__ = ['TomoLog32ID', ]
 
 FILE_NAME_PROJ1 = 'projection_google1.jpg'
 
+# Reconstruction figure and its panels, built on the first plot_recon call and reused after that
+_RECON_PLOT = {}
+
 
 class TomoLog32ID(TomoLog):
     '''
@@ -104,24 +105,19 @@ class TomoLog32ID(TomoLog):
         self.nct_resolution = float(self.meta[self.resolution_key][0])/1000
         self.mct_resolution = float(self.meta[self.pixel_size_key][0])
 
-    def read_raw(self):
+    def read_raw(self, fid):
         log.info('Reading nanoCT projection')
         proj = []
-        with h5py.File(self.args.file_name) as fid:
-            if self.double_fov == True:
-                log.warning('Data read: Handling the data set as a double FOV')
-                image_0 = np.flip(fid['exchange/data'][0][:], axis=1)
-                image_1 = fid['exchange/data'][-1][:]
-                data = np.hstack((image_0, image_1))
-            else:
-                data = fid['exchange/data'][0][:]
-            proj.append(data)
-            log.info('Reading CT projection')
-            try:
-                proj.append(fid['exchange/data2'][:])
-                log.info('Reading microCT projection')
-            except:
-                pass
+        if self.double_fov == True:
+            log.warning('Data read: Handling the data set as a double FOV')
+            data = utils.read_double_fov(fid['exchange/data'])
+        else:
+            data = utils.read_frame(fid['exchange/data'])
+        proj.append(data)
+        log.info('Reading CT projection')
+        if 'exchange/data2' in fid:
+            proj.append(utils.read_dataset(fid['exchange/data2']))
+            log.info('Reading microCT projection')
         return proj
 
     def read_recon(self):
@@ -132,7 +128,7 @@ class TomoLog32ID(TomoLog):
         try:
             if self.args.save_format == 'h5':
                 fname  = os.path.dirname(self.args.file_name)+'_rec/'+os.path.basename(self.args.file_name)[:-3]+'_rec.h5'
-                with h5py.File(fname,'r') as fid:
+                with h5py.File(fname,'r', **utils.H5_RECON_CACHE) as fid:
                     data = fid['exchange/recon']
                     h,w = data.shape[:2]
                     if self.args.idz == -1:
@@ -155,27 +151,33 @@ class TomoLog32ID(TomoLog):
                 rec_prefix = 'recon'
 
                 top = os.path.join(dirname+'_rec', basename+'_rec')
-                tiff_file_list = sorted(
-                    list(filter(lambda x: x.endswith(('.tif', '.tiff')), os.listdir(top))))
-                z_start = int(tiff_file_list[0].split('.')[0].split('_')[1])
-                z_end = int(tiff_file_list[-1].split('.')[0].split('_')[1]) + 1
+                if not os.path.isdir(top):
+                    log.error('Reconstructions for %s are missing. Please run the recontruction.' % top)
+                    log.warning('Skipping reconstruction')
+                    return recon
+                tiff_file_list = utils.recon_tiff_bounds(top)
+                z_start, z_end = utils.recon_slice_range(tiff_file_list)
                 height = z_end-z_start
                 fname_tmp = os.path.join(top, tiff_file_list[0])
                 # take size
-                tmp = utils.read_tiff(fname_tmp).copy()
+                tmp_shape = utils.read_tiff_shape(fname_tmp)
 
                 if self.double_fov == True:
                     width = width * 2
                     binning_rec = 1
                 else:
-                    binning_rec = width//tmp.shape[0]
+                    binning_rec = width//tmp_shape[0]
+                    if binning_rec == 0:
+                        log.error('Reconstructions for %s are larger than raw data image width. This is the case in a 0-360. Please use: --double-fov' % top)
+                        log.warning('Skipping reconstruction')
+                        return recon
 
                 w = width//binning_rec
                 h = height
 
                 #tmp
                 binning_rec = 1
-                w = tmp.shape[-1]
+                w = tmp_shape[-1]
 
 
                 if self.args.idz == -1:
@@ -190,113 +192,102 @@ class TomoLog32ID(TomoLog):
                     binning_rec = np.log2(width//w)
             
                 z = utils.read_tiff(
-                    f'{dirname}_rec/{basename}_rec/{rec_prefix}_{self.args.idz:05}.tiff').copy()
+                    f'{dirname}_rec/{basename}_rec/{rec_prefix}_{self.args.idz:05}.tiff')
+                if z is False:
+                    raise FileNotFoundError(f'slice {self.args.idz} not found')
 
                 # read x,y slices by lines
-                y = np.zeros((h, w), dtype='float32')
-                x = np.zeros((h, w), dtype='float32')
-
-                for j in range(z_start, z_end):
-                    zz = utils.read_tiff(
-                        f'{dirname}_rec/{basename}_rec/{rec_prefix}_{j:05}.tiff')
-                    y[j-z_start, :] = zz[self.args.idy]
-                    x[j-z_start, :] = zz[:, self.args.idx]
+                # every row is written by read_tiff_lines, which raises if a slice cannot be read
+                y = np.empty((h, w), dtype='float32')
+                x = np.empty((h, w), dtype='float32')
+
+                utils.read_tiff_lines(f'{dirname}_rec/{basename}_rec/{rec_prefix}', z_start,
+                                      x, y, self.args.idx, self.args.idy)
             
             # check if inversion is needed for the phase-contrast imaging at 32id
-            phase_ring_y = float(self.meta[self.phase_ring_setup_y_key][0])
-            coeff_rec = 1
-            if abs(phase_ring_y) < 1e-2:
-                coeff_rec = -1
-            
-            recon = [coeff_rec*x, coeff_rec*y, coeff_rec*z]
+            recon = [x, y, z]
+            if self.phase_ring_setup_y_key in self.meta and self.meta[self.phase_ring_setup_y_key][0] is not None:
+                if abs(float(self.meta[self.phase_ring_setup_y_key][0])) < 1e-2:
+                    # the slices are freshly read arrays: flip the sign in place
+                    for r in recon:
+                        np.negative(r, out=r)
             self.binning_rec = binning_rec
 
             log.info('Adding reconstruction')
-        except ZeroDivisionError:
-            log.error(
-                'Reconstructions for %s are larger than raw data image width. This is the case in a 0-360. Please use: --double-fov' % top)
-            log.warning('Skipping reconstruction')
-        except:
+        except (KeyError, IndexError, OSError, ValueError):
             log.warning('Skipping reconstruction')
 
         return recon
 
     def plot_projection(self, proj, fname,scalebar='nano'):
-        log.info('Plot projection')
-        # auto-adjust colorbar values according to a histogram
-        mmin, mmax = utils.find_min_max(proj)
-        proj[proj > mmax] = mmax
-        proj[proj < mmin] = mmin
-
-        # plot
-        fig = plt.figure(constrained_layout=True, figsize=(6, 4))
-        ax = fig.add_subplot()
-        im = ax.imshow(proj, cmap='gray')
-        # Create scale bar
         if scalebar=='nano':
-            scalebar = ScaleBar(self.nct_resolution, "um", length_fraction=0.25)
+            resolution = self.nct_resolution
         else:
-            scalebar = ScaleBar(self.mct_resolution, "um", length_fraction=0.25)
-        ax.add_artist(scalebar)
-        divider = make_axes_locatable(ax)
-        cax = divider.append_axes("right", size="5%", pad=0.1)
-        plt.colorbar(im, cax=cax)
-        # plt.show()
-        # save
-        plt.savefig(fname, bbox_inches='tight', pad_inches=0, dpi=300)
-        plt.cla()
-        plt.close(fig)
+            resolution = self.mct_resolution
+        super().plot_projection(proj, fname, resolution=resolution, colorbar_format=None)
 
     def plot_recon(self, recon, fname):
         log.info('Plot reconstruction')
-        fig = plt.figure(constrained_layout=True, figsize=(6, 12))
-        grid = fig.add_gridspec(3, 1, height_ratios=[1, 1, 1])
+        if not _RECON_PLOT:
+            _RECON_PLOT['fig'] = fig = plt.figure(constrained_layout=True, figsize=(6, 12))
+            _RECON_PLOT['grid'] = fig.add_gridspec(3, 1, height_ratios=[1, 1, 1])
+            _RECON_PLOT['panels'] = {}
+        fig, grid, panels = _RECON_PLOT['fig'], _RECON_PLOT['grid'], _RECON_PLOT['panels']
         slices = ['x', 'y', 'z']
         # autoadjust colorbar values according to a histogram
 
         if self.args.min == self.args.max:
-            self.args.min, self.args.max = utils.find_min_max(
-                np.concatenate(recon))
+            self.args.min, self.args.max = utils.find_min_max_fast(recon)
 
         sl = [self.args.idx, self.args.idy, self.args.idz]
         for k in range(3):
-            recon[k][0, 0] = self.args.max
-            recon[k][0, 1] = self.args.min
-            recon[k][recon[k] > self.args.max] = self.args.max
-            recon[k][recon[k] < self.args.min] = self.args.min
-            ax = fig.add_subplot(grid[k])
-            im = ax.imshow(recon[k], cmap='gray')
-            # Create scale bar
-            scalebar = ScaleBar(self.nct_resolution *
-                                2**self.binning_rec, "um", length_fraction=0.25)
-            ax.add_artist(scalebar)
-            divider = make_axes_locatable(ax)
-            cax = divider.append_axes("right", size="5%", pad=0.1)
-            plt.colorbar(im, cax=cax)
+            # a panel is about 1800 pixels wide in the saved figure: skip the pixels it cannot show
+            st = utils.plot_stride(recon[k].shape, 2048)
+            recon0 = recon[k][::st, ::st]
+            if k not in panels:
+                ax = fig.add_subplot(grid[k])
+                # the colormap saturates outside [vmin, vmax]: no need to clip or edit the slice
+                im = ax.imshow(recon0, cmap='gray', vmin=self.args.min, vmax=self.args.max)
+                # Create scale bar
+                scalebar = ScaleBar(self.nct_resolution *
+                                    2**self.binning_rec * st, "um", length_fraction=0.25)
+                ax.add_artist(scalebar)
+                divider = make_axes_locatable(ax)
+                cax = divider.append_axes("right", size="5%", pad=0.1)
+                fig.colorbar(im, cax=cax)
+                panels[k] = ax, im, scalebar
+            else:
+                # swap the slice and the scales; the colorbar follows the image limits
+                ax, im, scalebar = panels[k]
+                im.set_data(recon0)
+                im.set_extent((-0.5, recon0.shape[1] - 0.5, recon0.shape[0] - 0.5, -0.5))
+                im.set_clim(self.args.min, self.args.max)
+                scalebar.dx = self.nct_resolution * 2**self.binning_rec * st
             ax.set_ylabel(f'slice {slices[k]}={sl[k]}', fontsize=14)
         # save
-        plt.savefig(fname, bbox_inches='tight', pad_inches=0, dpi=300)
-        plt.cla()
-        plt.close(fig)
+        fig.savefig(fname, bbox_inches='tight', pad_inches=0, dpi=300, pil_kwargs=JPEG_OPTIONS)
 
     def publish_proj(self, presentation_id, page_id, proj):
         # 32-id datasets may include both nanoCT and microCT data as proj[0] and proj[1] respectively
         self.google_slide.create_textbox_with_text(
             presentation_id, page_id, 'Nano-CT projection', 90, 20, 10, 155, 8, 0)
         self.plot_projection(proj[0], self.file_name_proj0)
-        proj_url = cloud.upload(self.args, self.file_name_proj0)
+        # upload the nanoCT projection while the microCT one is plotted
+        proj_upload = cloud.upload_async(self.args, self.file_name_proj0)
+        if len(proj) > 1:
+            self.plot_projection(proj[1], self.file_name_proj1,scalebar='micro')
+            micro_upload = cloud.upload_async(self.args, self.file_name_proj1)
         log.info('Publish nanoCT projection')
         self.google_slide.create_image(
-            presentation_id, page_id, proj_url, 170, 170, 0, 145)
-        try:
+            presentation_id, page_id, proj_upload.result(), 170, 170, 0, 145)
+        if len(proj) > 1:
             self.google_slide.create_textbox_with_text(
                 presentation_id, page_id, 'Micro-CT projection', 90, 20, 10, 280, 8, 0)
-            self.plot_projection(proj[1], self.file_name_proj1,scalebar='micro')
-            proj_url = cloud.upload(self.args, self.file_name_proj1)
+            proj_url = micro_upload.result()
             log.info('Publish microCT projection')
             self.google_slide.create_image(
                 presentation_id, page_id, proj_url, 170, 170, 0, 270)
-        except:
+        else:
             log.warning('No microCT data available')
 
     def publish_recon(self, presentation_id, page_id, recon):
@@ -43,20 +43,6 @@
 # POSSIBILITY OF SUCH DAMAGE.                                             #
 # #########################################################################
 
-import os
-import uuid
-import pathlib
-import meta
-import h5py
-import numpy as np
-import matplotlib
-matplotlib.use('Agg')  # use non-GUI backend before importing pyplot
-import matplotlib.pyplot as plt
-from matplotlib_scalebar.scalebar import ScaleBar
-from mpl_toolkits.axes_grid1 import make_axes_locatable
-
-import meta
-
 from tomolog_cli import utils
 from tomolog_cli import log
 from tomolog_cli import TomoLog
@@ -93,33 +79,32 @@ class TomoLog7BM(TomoLog):
         descr = super().publish_descr(presentation_id, page_id)
         
         # add here beamline specific bullets
-        descr += self.read_meta_item(
-            "Attenuator 1: {self.meta[self.attenuator_1_name][0]} {self.meta[self.attenuator_1_thickness][0]}")
-        descr += self.read_meta_item(
-            "Attenuator 2: {self.meta[self.attenuator_2][0]}")
-        descr += self.read_meta_item(
-            "Attenuator 3: {self.meta[self.attenuator_3][0]}")
-        descr += self.read_meta_item(
-            "Sample Y: {self.meta[self.sample_y_key][0]:.02f} {self.meta[self.sample_y_key][1]}")
-        descr += self.read_meta_item(
-            "Propagation dist.: {self.meta[self.propogation_distance_key][0]:.02f} {self.meta[self.propogation_distance_key][1]}")
+        descr += ''.join([
+            self.read_meta_item(
+                "Attenuator 1: {self.meta[self.attenuator_1_name][0]} {self.meta[self.attenuator_1_thickness][0]}"),
+            self.read_meta_item(
+                "Attenuator 2: {self.meta[self.attenuator_2][0]}"),
+            self.read_meta_item(
+                "Attenuator 3: {self.meta[self.attenuator_3][0]}"),
+            self.read_meta_item(
+                "Sample Y: {self.meta[self.sample_y_key][0]:.02f} {self.meta[self.sample_y_key][1]}"),
+            self.read_meta_item(
+                "Propagation dist.: {self.meta[self.propogation_distance_key][0]:.02f} {self.meta[self.propogation_distance_key][1]}"),
+        ])
 
         descr = descr[:-1]
         self.google_slide.create_textbox_with_bullets(
             presentation_id, page_id, descr, 240, 120, 0, 18, 8, 0)
 
-    def read_raw(self):
+    def read_raw(self, fid):
         log.info('Reading microCT projection')
         proj = []
-        with h5py.File(self.args.file_name) as fid:
-            if self.double_fov == True:
-                log.warning('Data read: Handling the data set as a double FOV')
-                image_0 = np.flip(fid['exchange/data'][0][:], axis=1)
-                image_1 = fid['exchange/data'][-1][:]
-                data = np.hstack((image_0, image_1))
-            else:
-                data = fid['exchange/data'][0][:]
-            proj.append(data)
+        if self.double_fov == True:
+            log.warning('Data read: Handling the data set as a double FOV')
+            data = utils.read_double_fov(fid['exchange/data'])
+        else:
+            data = utils.read_frame(fid['exchange/data'])
+        proj.append(data)
         return proj
 
     def publish_proj(self, presentation_id, page_id, proj):
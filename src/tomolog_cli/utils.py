@@ -44,6 +44,7 @@
 # #########################################################################
 
 import os
+import re
 import h5py
 import datetime
 import tifffile
@@ -51,12 +52,59 @@ import tifffile
 import numpy as np
 
 from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 from tomolog_cli import log
 
+# chunk cache for reconstruction volumes: the x, y and z orthoslices cross the same
+# central chunks, so a cache that holds them saves re-reading and re-decompressing
+# them for the second and third slice (rdcc_nslots: a prime well above the chunk count)
+H5_RECON_CACHE = {'rdcc_nbytes': 64*1024*1024, 'rdcc_nslots': 10007}
+
+# slice number in reconstruction file names such as recon_00123.tiff
+RECON_INDEX = re.compile(r'_(\d+)')
+
+def recon_tiff_bounds(top):
+    """
+    Names of the tiff files with the lowest and highest slice number in directory top,
+    from a single scan. Slice numbers are compared as integers, so the bounds stay
+    right past 99999 slices, where the zero padded names stop sorting numerically.
+    """
+    first = last = None
+    with os.scandir(top) as it:
+        for entry in it:
+            name = entry.name
+            if not name.endswith(('.tif', '.tiff')):
+                continue
+            match = RECON_INDEX.search(name)
+            if match is None:
+                continue
+            index = int(match.group(1))
+            if first is None or index < first[0]:
+                first = index, name
+            if last is None or index > last[0]:
+                last = index, name
+    if first is None:
+        raise FileNotFoundError(f'no reconstruction tiff files in {top}')
+    return first[1], last[1]
+
+def recon_slice_range(tiff_file_list):
+    """First slice number and one past the last one of a sorted list of reconstruction file names"""
+    z_start = int(RECON_INDEX.search(tiff_file_list[0]).group(1))
+    z_end = int(RECON_INDEX.search(tiff_file_list[-1]).group(1)) + 1
+    return z_start, z_end
+
 def find_min_max(data,th=0.003):
-    """Find min and max values according to histogram"""
+    """Find min and max values according to histogram.
+    data can be a list of arrays: their histograms are merged over a common range,
+    which gives the same result as for np.concatenate(data) without the copy"""
 
-    h, e = np.histogram(data[:], 1000)
+    if isinstance(data, (list, tuple)):
+        hrange = (min(float(d.min()) for d in data), max(float(d.max()) for d in data))
+        h, e = np.histogram(data[0], 1000, range=hrange)
+        for d in data[1:]:
+            h += np.histogram(d, 1000, range=hrange)[0]
+    else:
+        h, e = np.histogram(data[:], 1000)
     stend = np.where(h > np.max(h)*th)
     st = stend[0][0]
     end = stend[0][-1]
@@ -64,13 +112,64 @@ def find_min_max(data,th=0.003):
     mmax = e[end+1]
     return mmin, mmax
 
-def read_tiff(fname):
+def find_min_max_fast(data, th=0.003, npixels=1024*1024):
+    """find_min_max on a strided subsample of about npixels pixels of each array.
+    The display range only needs the histogram shape, which a regular subsample of
+    a slice keeps, and it touches a fraction of the memory of the full arrays."""
+    arrays = data if isinstance(data, (list, tuple)) else [data]
+    sampled = []
+    for d in arrays:
+        step = max(1, int(np.sqrt(d.size / npixels)))
+        sampled.append(d[::step, ::step])
+    return find_min_max(sampled, th)
+
+def plot_stride(shape, npixels):
+    """Step that brings the longest side of an image of this shape down to about npixels"""
+    return max(1, max(shape) // npixels)
+
+def bin_image(data, step):
+    """Mean over step x step pixel blocks; trailing rows and columns that do not fill a block are dropped"""
+    h, w = data.shape[0] // step, data.shape[1] // step
+    return data[:h*step, :w*step].reshape(h, step, w, step).mean(axis=(1, 3), dtype=np.float32)
+
+def read_frame(dset, index=0):
+    """Read one projection of a 3D dataset straight into a new array"""
+    data = np.empty(dset.shape[1:], dtype=dset.dtype)
+    dset.read_direct(data, np.s_[index])
+    return data
+
+def read_dataset(dset):
+    """Read a whole dataset straight into a new array; dset[:] zero-fills its output first"""
+    data = np.empty(dset.shape, dtype=dset.dtype)
+    dset.read_direct(data)
+    return data
+
+def read_double_fov(dset):
+    """
+    Stitch the first projection, mirrored, and the last one side by side, as for a
+    0-360 double FOV scan. Both are read straight into the halves of the output.
+    """
+    nproj, height, width = dset.shape
+    data = np.empty((height, 2*width), dtype=dset.dtype)
+    dset.read_direct(data, np.s_[0], np.s_[:, :width])
+    dset.read_direct(data, np.s_[nproj-1], np.s_[:, width:])
+    # mirror the first half in blocks of rows: flipping the whole half at once makes
+    # numpy copy it to a temporary first, since source and destination overlap
+    for r in range(0, height, 64):
+        block = data[r:r+64, :width]
+        block[:] = block[:, ::-1]
+    return data
+
+def read_tiff(fname, maxworkers=None):
     """
     Read data from tiff file.
     Parameters
     ----------
     fname : str
         String defining the path of file or file name.
+    maxworkers : int, optional
+        Threads used by tifffile to decode a compressed image. None lets
+        tifffile pick, which uses several cores for large images.
 
     Returns
     -------
@@ -79,7 +178,7 @@ def read_tiff(fname):
     """
 
     try:
-        arr = tifffile.imread(fname)
+        arr = tifffile.imread(fname, maxworkers=maxworkers)
     except IOError:
         log.error('No such file or directory: %s', fname)
         return False
@@ -87,42 +186,37 @@ def read_tiff(fname):
     return arr
 
 
-def read_tiff_chunk(x,y, fname,idx,idy, k, lchunk):
-    """Read a chunk of data from tiff"""
-    log.info(k,st,end)
-    st = k*lchunk
-    end = min((k+1)*lchunk,rec.shape[0])
-    zz = dxchange.read_tiff_stack(fname,ind=range(st,end))
-    y[st:end, :] = zz[dy]
-    x[st:end, :] = zz[:, idx]
-
-
-def read_tiff_many(fname, z_start, z_end,idx, idy, nproc=8):
-    t = time.time()        
-    d = dxchange.read_tiff(fname)
-    n = d.shape[-1]
-    nz = z_end- z_start
-    
-    # read x,y slices by lines
-    y = np.zeros((nz, n), dtype='float32')
-    x = np.zeros((nz, n), dtype='float32')
-
-    lchunk = int(np.ceil(nz/nproc))
-    procs = []
-    for k in range(nproc):
-        read_proc = threading.Thread(
-            target=read_tiff_chunk, args=(x, y, fname, idx,idy, k, lchunk))
-        procs.append(read_proc)
-        read_proc.start()
-    for proc in procs:
-        proc.join()
-    log.info(time.time()-t)
-    
-def read_tiff_part(args, fname, x, y, z_start, z0_start, lchunk):
-    # print('!',z0_start,z_start)
-    for j in range(z0_start, z0_start + lchunk):
-        # print(j)
-        id = z_start + j
-        zz = read_tiff(f'{fname}_{id:05}.tiff')
-        y[j, :] = zz[args.idy]
-        x[j, :] = zz[:, args.idx]
\ No newline at end of file
+def read_tiff_shape(fname):
+    """Image shape of a tiff file, taken from its header without decoding the pixels"""
+    with tifffile.TiffFile(fname) as tif:
+        return tif.pages[0].shape
+
+def read_tiff_mapped(fname, maxworkers=None):
+    """
+    Memory-map an uncompressed tiff so that slicing it only touches the pages
+    holding the requested pixels; compressed files are read with read_tiff.
+    """
+    try:
+        return tifffile.memmap(fname, mode='r')
+    except ValueError:
+        return read_tiff(fname, maxworkers=maxworkers)
+
+def read_tiff_lines(fname, z_start, x, y, idx, idy, nthreads=None):
+    """
+    Fill x and y with the idx column and idy row of each slice of a tiff stack.
+    Slices fname_{z_start+j:05}.tiff are read in a thread pool and only the
+    two lines are kept, so the stack is never held in memory. The reads wait
+    on the disk far more than on the cpu: by default the pool is sized for
+    I/O-bound work (min(32, cpu count + 4) threads) rather than a fixed 8.
+    """
+    slice_name = (fname + '_{:05}.tiff').format
+
+    def read_slice(j):
+        # the pool already spreads the slices over the cores: decode each one single-threaded
+        zz = read_tiff_mapped(slice_name(z_start + j), maxworkers=1)
+        y[j, :] = zz[idy]
+        x[j, :] = zz[:, idx]
+
+    with ThreadPoolExecutor(nthreads) as executor:
+        # list() re-raises the first read error in the caller
+        list(executor.map(read_slice, range(x.shape[0])))